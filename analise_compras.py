@@ -0,0 +1,1479 @@
+"""Cálculos do painel de compras, sem dependência de Streamlit ou Plotly."""
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import os
+import io
+import json
+import hashlib
+import tempfile
+import threading
+import copy
+import shutil
+from datetime import datetime, timedelta
+
+from instrumentacao import cronometrado
+
+CAMINHO_CSV = 'df_compra.csv'
+DIRETORIO_CACHE = '.cache_compra'
+TAMANHO_CAUDA = 64 * 1024
+LIMITE_PARTES = 32
+
+meses_abreviados_num_para_abv = {
+    1: 'Jan', 2: 'Fev', 3: 'Mar', 4: 'Abr', 5: 'Mai', 6: 'Jun',
+    7: 'Jul', 8: 'Ago', 9: 'Set', 10: 'Out', 11: 'Nov', 12: 'Dez'
+}
+
+
+def _converter_datas(df):
+    # Formato explícito: inferir a partir da primeira linha daria resultados
+    # diferentes para cada trecho lido na ingestão incremental.
+    df['data entrega prevista'] = pd.to_datetime(df['data entrega prevista'], format='%d/%m/%Y', errors='coerce')
+    df['data entrada'] = pd.to_datetime(df['data entrada'], format='%d/%m/%Y', errors='coerce')
+    df['data emissao'] = pd.to_datetime(df['data emissao'], format='%d/%m/%Y', errors='coerce')
+    return df
+
+
+def _ler_csv_compra(caminho):
+    return _converter_datas(pd.read_csv(caminho))
+
+
+def _ler_trecho_csv(caminho, inicio, fim):
+    # Lê só os bytes [inicio, fim) do CSV, reaproveitando a linha de cabeçalho.
+    with open(caminho, 'rb') as arquivo:
+        cabecalho = arquivo.readline()
+        arquivo.seek(inicio)
+        dados = arquivo.read(fim - inicio)
+    return _converter_datas(pd.read_csv(io.BytesIO(cabecalho + dados)))
+
+
+def _alinhar_tipos(df_delta, referencia):
+    for coluna, tipo in referencia.dtypes.items():
+        if coluna in df_delta.columns and df_delta[coluna].dtype != tipo:
+            if tipo == object:
+                # Um trecho pequeno pode ter só valores numéricos numa coluna de texto
+                # (ex.: prazo '30'); sem isso a coluna ficaria com int e str misturados.
+                df_delta[coluna] = df_delta[coluna].astype(str).where(df_delta[coluna].notna())
+                continue
+            try:
+                df_delta[coluna] = df_delta[coluna].astype(tipo)
+            except (ValueError, TypeError):
+                pass
+    return df_delta
+
+
+# Textos repetidos viram category (um código inteiro por linha e cada texto guardado uma vez).
+COLUNAS_CATEGORICAS = ['fornecedor', 'cidade fornecedor', 'situacao pedido', 'usuario', 'prazo', 'descricao produto',
+                       'tipo produto', 'status pedido', 'tipo fornecedor', 'mes_nome']
+
+
+def compactar_tipos(df):
+    """
+    Reduz a memória do DataFrame de compras para o conjunto compartilhado em memória.
+
+    As colunas de `COLUNAS_CATEGORICAS` viram category com categorias ordenadas (então
+    `pd.factorize(..., sort=True)` continua na mesma ordem dos textos) e colunas
+    inteiras passam para o menor tipo inteiro que comporta os valores. Colunas float
+    ficam em float64: são valores em reais e somas em float32 perderiam centavos.
+    """
+    for coluna in COLUNAS_CATEGORICAS:
+        if coluna in df.columns and not isinstance(df[coluna].dtype, pd.CategoricalDtype):
+            df[coluna] = pd.Categorical(df[coluna])
+    for coluna in df.select_dtypes(include='integer').columns:
+        df[coluna] = pd.to_numeric(df[coluna], downcast='integer')
+    return df
+
+
+def _concatenar_compacto(df, df_delta):
+    """Anexa `df_delta` (já compactado) a `df`, unindo as categorias das colunas category."""
+    colunas = {}
+    for coluna in df.columns:
+        if isinstance(df[coluna].dtype, pd.CategoricalDtype):
+            categorias = df[coluna].cat.categories.union(pd.Index(df_delta[coluna].dropna().unique()))
+            # set_categories só remapeia os códigos; os textos não são comparados de novo.
+            colunas[coluna] = pd.concat([df[coluna].cat.set_categories(categorias),
+                                         df_delta[coluna].astype(object).astype(pd.CategoricalDtype(categorias))],
+                                        ignore_index=True)
+        else:
+            # Inteiros de tamanhos diferentes sobem para o maior tipo dos dois lados.
+            colunas[coluna] = pd.concat([df[coluna], df_delta[coluna]], ignore_index=True)
+    return pd.DataFrame(colunas)
+
+
+def _hash_trecho(caminho, inicio, fim, tamanho_bloco=1 << 20):
+    h = hashlib.sha256()
+    with open(caminho, 'rb') as arquivo:
+        arquivo.seek(inicio)
+        restante = fim - inicio
+        while restante > 0:
+            bloco = arquivo.read(min(tamanho_bloco, restante))
+            if not bloco:
+                break
+            h.update(bloco)
+            restante -= len(bloco)
+    return h.hexdigest()
+
+
+def _assinatura_cauda(caminho, tamanho):
+    inicio = max(0, tamanho - TAMANHO_CAUDA)
+    return {'inicio': inicio, 'hash': _hash_trecho(caminho, inicio, tamanho)}
+
+
+def _segmentos_intactos(caminho, segmentos):
+    """Confere, trecho a trecho, se o CSV ainda tem o conteúdo registrado nos segmentos."""
+    return all(_hash_trecho(caminho, s['inicio'], s['fim']) == s['hash'] for s in segmentos)
+
+
+def _e_anexo(caminho, meta, tamanho_atual):
+    """
+    Indica se o CSV apenas recebeu linhas novas após o trecho já ingerido.
+
+    Confere só a cauda (64 KiB) e o último segmento, para que cada anexo custe a
+    leitura do trecho novo e não do arquivo inteiro. Uma edição de mesmo tamanho em
+    segmentos anteriores passa despercebida aqui; a carga a frio e a compactação
+    conferem todos os segmentos com `_segmentos_intactos`.
+    """
+    tamanho = meta['tamanho']
+    if tamanho_atual <= tamanho or tamanho == 0:
+        return False
+    with open(caminho, 'rb') as arquivo:
+        arquivo.seek(tamanho - 1)
+        if arquivo.read(1) != b'\n':
+            return False
+    if _assinatura_cauda(caminho, tamanho) != meta.get('cauda'):
+        return False
+    segmentos = meta['segmentos']
+    if not segmentos or segmentos[-1]['fim'] != tamanho:
+        return False
+    return _segmentos_intactos(caminho, segmentos[-1:])
+
+
+def _escrever_atomico(caminho, escrever):
+    # Grava em arquivo temporário no mesmo diretório e troca com os.replace,
+    # assim nenhum leitor enxerga um snapshot pela metade.
+    fd, caminho_tmp = tempfile.mkstemp(dir=os.path.dirname(caminho), suffix='.tmp')
+    os.close(fd)
+    try:
+        escrever(caminho_tmp)
+        os.replace(caminho_tmp, caminho)
+    finally:
+        if os.path.exists(caminho_tmp):
+            os.remove(caminho_tmp)
+
+
+def _gravar_json(caminho, dados):
+    with open(caminho, 'w', encoding='utf-8') as arquivo:
+        json.dump(dados, arquivo)
+
+
+def _caminhos_cache(caminho_csv, diretorio_cache):
+    nome_base = os.path.splitext(os.path.basename(caminho_csv))[0]
+    return os.path.join(diretorio_cache, nome_base), os.path.join(diretorio_cache, f'{nome_base}.meta.json')
+
+
+def _remover_snapshot(caminho_csv, diretorio_cache):
+    """Apaga as partes e o meta do snapshot de `caminho_csv`."""
+    diretorio_partes, caminho_meta = _caminhos_cache(caminho_csv, diretorio_cache)
+    shutil.rmtree(diretorio_partes, ignore_errors=True)
+    try:
+        os.remove(caminho_meta)
+    except OSError:
+        pass
+
+
+def _ler_meta(caminho_meta, diretorio_partes):
+    try:
+        with open(caminho_meta, encoding='utf-8') as arquivo:
+            meta = json.load(arquivo)
+    except (OSError, ValueError):
+        return None
+    segmentos = meta.get('segmentos')
+    if not segmentos or not all(os.path.exists(os.path.join(diretorio_partes, s['parte'])) for s in segmentos):
+        return None
+    return meta
+
+
+def _ler_partes(diretorio_partes, meta):
+    partes = [pd.read_parquet(os.path.join(diretorio_partes, s['parte']), memory_map=True) for s in meta['segmentos']]
+    if len(partes) == 1:
+        return partes[0]
+    return _unir_partes(partes)
+
+
+def _unir_partes(partes):
+    for i in range(1, len(partes)):
+        partes[i] = _alinhar_tipos(partes[i], partes[0])
+    return pd.concat(partes, ignore_index=True)
+
+
+def _gravar_segmento(caminho_csv, diretorio_partes, df_trecho, inicio, fim):
+    nome_parte = f'parte-{inicio:015d}-{fim:015d}.parquet'
+    _escrever_atomico(os.path.join(diretorio_partes, nome_parte), lambda tmp: df_trecho.to_parquet(tmp, index=False))
+    return {'inicio': inicio, 'fim': fim, 'hash': _hash_trecho(caminho_csv, inicio, fim), 'parte': nome_parte}
+
+
+def _gravar_meta(caminho_csv, caminho_meta, diretorio_partes, segmentos, stat):
+    meta = {
+        'tamanho': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'cauda': _assinatura_cauda(caminho_csv, stat.st_size),
+        'segmentos': segmentos,
+    }
+    _escrever_atomico(caminho_meta, lambda tmp: _gravar_json(tmp, meta))
+    # Remove partes que não pertencem mais ao snapshot (reconstrução ou compactação).
+    em_uso = {s['parte'] for s in segmentos}
+    for nome in os.listdir(diretorio_partes):
+        if nome.endswith('.parquet') and nome not in em_uso:
+            try:
+                os.remove(os.path.join(diretorio_partes, nome))
+            except OSError:
+                pass
+    return meta
+
+
+def _meta_sem_snapshot(caminho_csv, meta, stat):
+    # O snapshot em disco não acompanhou esta carga. Os metadados em memória ganham um
+    # segmento só com o hash do trecho novo (sem parte), para que `_e_anexo` e
+    # `_segmentos_intactos` continuem cobrindo o arquivo inteiro.
+    segmento = {'inicio': meta['tamanho'], 'fim': stat.st_size,
+                'hash': _hash_trecho(caminho_csv, meta['tamanho'], stat.st_size)}
+    return dict(meta, tamanho=stat.st_size, mtime_ns=stat.st_mtime_ns,
+                cauda=_assinatura_cauda(caminho_csv, stat.st_size), segmentos=meta['segmentos'] + [segmento])
+
+
+def _reconstruir_snapshot(caminho_csv, diretorio_partes, caminho_meta, stat, df=None):
+    if df is None:
+        df = _ler_csv_compra(caminho_csv)
+    try:
+        os.makedirs(diretorio_partes, exist_ok=True)
+        segmento = _gravar_segmento(caminho_csv, diretorio_partes, df, 0, stat.st_size)
+        meta = _gravar_meta(caminho_csv, caminho_meta, diretorio_partes, [segmento], stat)
+    except (OSError, ImportError) as erro:
+        print(f"Não foi possível gravar o snapshot de dados: {erro}")
+        meta = _meta_sem_snapshot(caminho_csv, {'tamanho': 0, 'segmentos': []}, stat)
+    return df, meta
+
+
+def _anexar_ao_snapshot(caminho_csv, diretorio_partes, caminho_meta, meta, df_delta, stat):
+    """Grava o delta como uma nova parte do snapshot e devolve os metadados atualizados."""
+    meta_disco = _ler_meta(caminho_meta, diretorio_partes)
+    # Só anexa se o snapshot em disco está exatamente onde este processo parou;
+    # caso contrário outro processo já o avançou (ou ele será reconstruído na próxima carga).
+    if meta_disco is None or (meta_disco['tamanho'], meta_disco['cauda']) != (meta['tamanho'], meta['cauda']):
+        return _meta_sem_snapshot(caminho_csv, meta, stat)
+    segmentos = list(meta_disco['segmentos'])
+    try:
+        segmentos.append(_gravar_segmento(caminho_csv, diretorio_partes, df_delta, meta['tamanho'], stat.st_size))
+        return _gravar_meta(caminho_csv, caminho_meta, diretorio_partes, segmentos, stat)
+    except (OSError, ImportError) as erro:
+        print(f"Não foi possível anexar ao snapshot de dados: {erro}")
+        return _meta_sem_snapshot(caminho_csv, meta, stat)
+
+
+def _carregar_snapshot(caminho_csv, diretorio_cache):
+    diretorio_partes, caminho_meta = _caminhos_cache(caminho_csv, diretorio_cache)
+    stat = os.stat(caminho_csv)
+    meta = _ler_meta(caminho_meta, diretorio_partes)
+
+    if meta is not None:
+        try:
+            if meta['tamanho'] == stat.st_size:
+                if meta['mtime_ns'] != stat.st_mtime_ns:
+                    # Arquivo tocado: confere o conteúdo segmento a segmento.
+                    if not _segmentos_intactos(caminho_csv, meta['segmentos']):
+                        return _reconstruir_snapshot(caminho_csv, diretorio_partes, caminho_meta, stat)
+                    meta = _gravar_meta(caminho_csv, caminho_meta, diretorio_partes, meta['segmentos'], stat)
+                df = _ler_partes(diretorio_partes, meta)
+            elif _e_anexo(caminho_csv, meta, stat.st_size) and _segmentos_intactos(caminho_csv, meta['segmentos']):
+                # Na carga a frio o snapshot pode ser de outra execução: confere tudo.
+                df = _ler_partes(diretorio_partes, meta)
+                df_delta = _alinhar_tipos(_ler_trecho_csv(caminho_csv, meta['tamanho'], stat.st_size), df)
+                meta = _anexar_ao_snapshot(caminho_csv, diretorio_partes, caminho_meta, meta, df_delta, stat)
+                df = pd.concat([df, df_delta], ignore_index=True)
+            else:
+                return _reconstruir_snapshot(caminho_csv, diretorio_partes, caminho_meta, stat)
+        except (OSError, ValueError):
+            return _reconstruir_snapshot(caminho_csv, diretorio_partes, caminho_meta, stat)
+
+        if len(meta['segmentos']) > LIMITE_PARTES:
+            # A compactação grava `df` com o hash do arquivo atual: só vale se o
+            # conteúdo de todos os segmentos ainda confere.
+            if not _segmentos_intactos(caminho_csv, meta['segmentos']):
+                return _reconstruir_snapshot(caminho_csv, diretorio_partes, caminho_meta, stat)
+            return _reconstruir_snapshot(caminho_csv, diretorio_partes, caminho_meta, stat, df=df)
+        return df, meta
+
+    return _reconstruir_snapshot(caminho_csv, diretorio_partes, caminho_meta, stat)
+
+
+@cronometrado
+def carregar_dados(caminho_csv=CAMINHO_CSV, diretorio_cache=DIRETORIO_CACHE):
+    """
+    Carrega o CSV de compras usando um snapshot Parquet tipado como cache.
+
+    O snapshot é identificado por tamanho, mtime e hashes SHA-256 dos trechos do CSV.
+    Se tamanho e mtime não mudaram, as partes do snapshot são lidas direto (com memory
+    map), sem parse de texto nem conversão de datas. Se o CSV só recebeu linhas novas
+    no final, apenas esse trecho é convertido e gravado como uma nova parte (o trecho
+    anterior só tem os hashes conferidos). Qualquer outra mudança de conteúdo
+    reconstrói o snapshot.
+
+    Args:
+        caminho_csv (str): Caminho do CSV exportado.
+        diretorio_cache (str): Diretório onde ficam o snapshot e seus metadados.
+
+    Returns:
+        pd.DataFrame: Dados de compra com as colunas de data já em datetime.
+    """
+    return _carregar_snapshot(caminho_csv, diretorio_cache)[0]
+
+
+DIMENSOES_CUBO = ['ano', 'mes', 'usuario', 'situacao pedido', 'tipo fornecedor', 'status pedido', 'fornecedor']
+
+
+class CuboCompra:
+    """
+    Cubo pré-agregado que responde os cards de métricas e os gráficos do painel.
+
+    Cada célula, chaveada por `DIMENSOES_CUBO`, guarda a soma de 'valor liquido item',
+    a soma de 'qtd pedido item' e a contagem de linhas de item. Os pedidos distintos
+    ficam numa tabela à parte com uma linha por (célula, numeropedido), o que permite
+    contar pedidos únicos em qualquer recorte sem voltar às linhas de item.
+
+    Cada dimensão é guardada como códigos inteiros de um vocabulário que só ganha
+    valores novos, então uma célula nunca muda de posição. `atualizar` agrega só as
+    linhas novas, soma nas células que elas tocam e anexa as células e os pedidos
+    novos; fora isso, apenas copia os arrays (para não alterar o cubo da versão
+    anterior). Um pedido que recebe itens numa célula onde já estava pode aparecer
+    repetido na tabela de pedidos: as contagens são de pedidos distintos, então
+    nenhum resultado muda, e a próxima carga completa remonta o cubo sem repetições.
+    """
+
+    def __init__(self):
+        # Vocabulários e posições das células só crescem: são compartilhados com as
+        # cópias do cubo, que só enxergam os códigos e posições que já existiam nelas.
+        self._vocabulario = {dimensao: {} for dimensao in DIMENSOES_CUBO}
+        self._valores = {dimensao: [] for dimensao in DIMENSOES_CUBO}
+        self._posicao_celula = {}
+        self.codigos = {dimensao: np.empty(0, dtype=np.int64) for dimensao in DIMENSOES_CUBO}
+        self.valor = np.empty(0)
+        self.quantidade = np.empty(0)
+        self.linhas = np.empty(0, dtype=np.int64)
+        self.pedido_celula = np.empty(0, dtype=np.int64)
+        self.pedido_numero = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.valor)
+
+    def _codificar(self, dimensao, serie):
+        codigos, valores = pd.factorize(serie)
+        vocabulario, lista = self._vocabulario[dimensao], self._valores[dimensao]
+        traducao = np.empty(len(valores) + 1, dtype=np.int64)
+        traducao[-1] = -1
+        for i, valor in enumerate(valores.tolist()):
+            codigo = vocabulario.get(valor)
+            if codigo is None:
+                codigo = vocabulario[valor] = len(lista)
+                lista.append(valor)
+            traducao[i] = codigo
+        # Código -1 (ausente) cai na última posição da tradução e continua -1.
+        return traducao[codigos]
+
+    def atualizar(self, df_delta):
+        if df_delta.empty:
+            return
+        codigos = [self._codificar(dimensao, df_delta[dimensao]) + 1 for dimensao in DIMENSOES_CUBO]
+        # Uma chave inteira por linha (códigos deslocados em 1 para o ausente virar 0).
+        tamanhos = [int(codigo.max()) + 1 for codigo in codigos]
+        if np.prod(np.array(tamanhos, dtype=float)) < 2 ** 62:
+            celula_item, chaves = pd.factorize(np.ravel_multi_index(codigos, tamanhos))
+            chaves = np.column_stack(np.unravel_index(chaves, tamanhos)) - 1
+        else:
+            chaves, celula_item = np.unique(np.column_stack(codigos) - 1, axis=0, return_inverse=True)
+            celula_item = celula_item.ravel()
+
+        n_celulas = len(self)
+        posicoes = np.empty(len(chaves), dtype=np.int64)
+        novas = []
+        for i, chave in enumerate(map(tuple, chaves.tolist())):
+            posicao = self._posicao_celula.get(chave)
+            # Posições além do tamanho deste cubo vêm de uma atualização que não chegou a
+            # ser publicada: para esta versão a célula ainda é nova.
+            if posicao is None or posicao >= n_celulas:
+                posicao = n_celulas + len(novas)
+                novas.append((chave, posicao))
+            posicoes[i] = posicao
+
+        so_novas = posicoes >= n_celulas
+        tamanho = n_celulas + len(novas)
+        somas = [np.bincount(celula_item, weights=np.nan_to_num(df_delta[coluna].to_numpy(dtype=float)),
+                             minlength=len(chaves)) for coluna in ['valor liquido item', 'qtd pedido item']]
+        contagem = np.bincount(celula_item, minlength=len(chaves))
+        self.valor, self.quantidade, self.linhas = [
+            np.concatenate([atual, np.zeros(tamanho - n_celulas, dtype=atual.dtype)])
+            for atual in (self.valor, self.quantidade, self.linhas)]
+        self.valor[posicoes] += somas[0]
+        self.quantidade[posicoes] += somas[1]
+        self.linhas[posicoes] += contagem
+        self.codigos = {dimensao: np.concatenate([self.codigos[dimensao], chaves[so_novas, j]])
+                        for j, dimensao in enumerate(DIMENSOES_CUBO)}
+
+        pedidos = pd.DataFrame({'celula': posicoes[celula_item],
+                                'numeropedido': df_delta['numeropedido'].to_numpy()}).drop_duplicates()
+        self.pedido_celula = np.concatenate([self.pedido_celula, pedidos['celula'].to_numpy()])
+        self.pedido_numero = np.concatenate([self.pedido_numero, pedidos['numeropedido'].to_numpy()])
+        self._posicao_celula.update(novas)
+
+    def _mascara(self, ano='todos', mes='todos', usuario='todos', situacao='todos', tipo_fornecedor='todos'):
+        filtros, _ = _resolver_filtros(ano, mes, usuario, situacao, tipo_fornecedor)
+        mascara = np.ones(len(self), dtype=bool)
+        for coluna, valor in filtros.items():
+            codigo = self._vocabulario[coluna].get(valor)
+            if codigo is None:
+                return np.zeros(len(self), dtype=bool)
+            mascara &= self.codigos[coluna] == codigo
+        return mascara
+
+    def _somar(self, dimensoes, pesos, mascara, coluna):
+        """Soma de `pesos` por combinação de valores de `dimensoes`, ordenada por esses valores."""
+        codigos = [self.codigos[dimensao][mascara] for dimensao in dimensoes]
+        tamanhos = [len(self._valores[dimensao]) for dimensao in dimensoes]
+        validos = np.logical_and.reduce([codigo >= 0 for codigo in codigos])
+        chave = np.ravel_multi_index([codigo[validos] for codigo in codigos], tamanhos)
+        total = int(np.prod(tamanhos))
+        somas = np.bincount(chave, weights=pesos[mascara][validos], minlength=total)
+        presentes = np.flatnonzero(np.bincount(chave, minlength=total))
+        resultado = {dimensao: np.asarray(self._valores[dimensao], dtype=object)[codigo].tolist()
+                     for dimensao, codigo in zip(dimensoes, np.unravel_index(presentes, tamanhos))}
+        resultado[coluna] = somas[presentes]
+        return pd.DataFrame(resultado, columns=dimensoes + [coluna]).sort_values(dimensoes, kind='stable',
+                                                                                 ignore_index=True)
+
+    @cronometrado
+    def metricas(self, **filtros):
+        """Mesmo retorno de `calcular_metricas` para o recorte dos filtros."""
+        mascara = self._mascara(**filtros)
+        selecionados = mascara[self.pedido_celula]
+        numeros = pd.Series(self.pedido_numero[selecionados])
+        situacao = self.codigos['situacao pedido'][self.pedido_celula[selecionados]]
+
+        def pedidos_com_situacao(valor):
+            codigo = self._vocabulario['situacao pedido'].get(valor)
+            return numeros[situacao == codigo].nunique() if codigo is not None else 0
+
+        return (numeros.nunique(),
+                self.valor[mascara].sum(),
+                int(self.quantidade[mascara].sum()),
+                pedidos_com_situacao('fechado pedido chegou'),
+                pedidos_com_situacao('pendente'))
+
+    @cronometrado
+    def contagem_status(self, **filtros):
+        contagem = self._somar(['status pedido'], self.linhas, self._mascara(**filtros), 'quantidade')
+        contagem['quantidade'] = contagem['quantidade'].astype(int)
+        return contagem.sort_values('quantidade', ascending=False, kind='stable', ignore_index=True)
+
+    @cronometrado
+    def valor_por_mes(self, **filtros):
+        somas = self._somar(['ano', 'mes'], self.valor, self._mascara(**filtros), 'valor liquido item')
+        somas['mes_nome'] = somas['mes'].map(meses_abreviados_num_para_abv)
+        return somas[['ano', 'mes_nome', 'valor liquido item']]
+
+    @cronometrado
+    def top_fornecedores(self, n=10, **filtros):
+        somas = self._somar(['fornecedor'], self.valor, self._mascara(**filtros), 'valor liquido item')
+        return somas.nlargest(n, 'valor liquido item').reset_index(drop=True)
+
+
+COLUNAS_PENDENTES = ['numeropedido', 'status pedido', 'data emissao', 'data entrega prevista', 'data entrada',
+                     'fornecedor', 'descricao produto', 'total itens', 'valor liquido item']
+ORDENACOES_PENDENTES = {
+    'Dias em Atraso': 'dias em atraso', 'Valor': 'valor liquido item', 'Entrega Prevista': 'data entrega prevista',
+    'Emissão': 'data emissao', 'Fornecedor': 'fornecedor', 'Pedido': 'numeropedido',
+}
+
+
+def _dias_desde_epoca(datas):
+    """Datas como dias (float) desde 1970-01-01; datas ausentes viram NaN."""
+    datas = np.asarray(datas, dtype='datetime64[D]')
+    return np.where(np.isnat(datas), np.nan, datas.astype(np.int64).astype(float))
+
+
+class PedidosPendentes:
+    """
+    Itens com 'situacao pedido' == 'pendente' e o resumo deles, montados uma vez por
+    versão dos dados.
+
+    O resumo (pedidos, itens, valor total, datas inválidas e entrega prevista por
+    pedido, para contar atrasados) não depende das linhas exibidas. `filtrar` resolve
+    fornecedor, atraso mínimo, valor mínimo e ordenação sobre arrays e devolve só
+    posições; `pagina` monta o DataFrame apenas das linhas da página pedida.
+    """
+
+    def __init__(self, df, posicoes):
+        itens = df[COLUNAS_PENDENTES].take(posicoes).reset_index(drop=True)
+        self._emissao = _dias_desde_epoca(itens['data emissao'])
+        self._prevista = _dias_desde_epoca(itens['data entrega prevista'])
+        itens['prazo entrega (dias)'] = pd.array(self._prevista - self._emissao, dtype='Int64')
+        self.itens = itens
+        self._valores = itens['valor liquido item'].to_numpy(dtype=float)
+        self._codigos_fornecedor = pd.Categorical(itens['fornecedor']).codes if len(itens) else np.empty(0, dtype=np.int8)
+
+        # Entrega prevista de cada pedido (a mais cedo entre os itens), ordenada para
+        # contar os atrasados de qualquer data com um `searchsorted`.
+        prevista_pedidos = pd.Series(self._prevista).groupby(itens['numeropedido'].to_numpy()).min().to_numpy()
+        self._prevista_pedidos = np.sort(prevista_pedidos[~np.isnan(prevista_pedidos)])
+        self.n_pedidos = len(prevista_pedidos)
+        self.valor_total = float(np.nansum(self._valores))
+        self.datas_invalidas = int(np.count_nonzero(np.isnan(self._emissao) | np.isnan(self._prevista)))
+        self.fornecedores = sorted(itens['fornecedor'].dropna().unique().tolist())
+
+    @staticmethod
+    def _hoje(hoje):
+        return float(np.datetime64((hoje or datetime.now()).date(), 'D').astype(np.int64))
+
+    def resumo(self, hoje=None):
+        """Totais dos itens pendentes; 'pedidos_atrasados' conta entregas previstas antes de `hoje`."""
+        return {
+            'pedidos': self.n_pedidos,
+            'itens': len(self.itens),
+            'valor_total': self.valor_total,
+            'pedidos_atrasados': int(np.searchsorted(self._prevista_pedidos, self._hoje(hoje))),
+            'datas_invalidas': self.datas_invalidas,
+        }
+
+    @cronometrado
+    def filtrar(self, fornecedor='todos', atraso_minimo=None, valor_minimo=None, ordenar_por='dias em atraso',
+                decrescente=True, hoje=None):
+        """
+        Seleciona e ordena os itens pendentes sem montar nenhum DataFrame.
+
+        Args:
+            fornecedor (str): Fornecedor exato ou 'todos'.
+            atraso_minimo (int): Só itens com pelo menos esse número de dias de atraso.
+            valor_minimo (float): Só itens com 'valor liquido item' a partir desse valor.
+            ordenar_por (str): Um dos valores de `ORDENACOES_PENDENTES`.
+            decrescente (bool): Ordem decrescente; valores ausentes ficam sempre no fim.
+            hoje (datetime): Data de referência do atraso; padrão `datetime.now()`.
+
+        Returns:
+            np.ndarray: Posições em `itens`, já na ordem de exibição.
+        """
+        atraso = self._hoje(hoje) - self._prevista
+        selecionados = np.ones(len(self.itens), dtype=bool)
+        if fornecedor != 'todos':
+            selecionados &= (self.itens['fornecedor'] == fornecedor).to_numpy()
+        if atraso_minimo is not None:
+            selecionados &= atraso >= atraso_minimo
+        if valor_minimo is not None:
+            selecionados &= self._valores >= valor_minimo
+
+        if ordenar_por == 'dias em atraso':
+            chave = atraso
+        elif ordenar_por == 'fornecedor':
+            chave = np.where(self._codigos_fornecedor < 0, np.nan, self._codigos_fornecedor)
+        elif ordenar_por in ('data emissao', 'data entrega prevista'):
+            chave = self._emissao if ordenar_por == 'data emissao' else self._prevista
+        else:
+            chave = self.itens[ordenar_por].to_numpy(dtype=float, na_value=np.nan)
+        ordem = np.argsort(-chave if decrescente else chave, kind='stable')
+        return ordem[selecionados[ordem]]
+
+    @cronometrado
+    def pagina(self, posicoes, numero=1, tamanho=50, hoje=None):
+        """Linhas da página `numero` (a partir de 1) de `posicoes`, com a coluna 'dias em atraso'."""
+        inicio = (numero - 1) * tamanho
+        selecao = posicoes[inicio:inicio + tamanho]
+        pagina = self.itens.take(selecao)
+        pagina['dias em atraso'] = pd.array(self._hoje(hoje) - self._prevista[selecao], dtype='Int64')
+        return pagina
+
+    def valor(self, posicoes):
+        return float(np.nansum(self._valores[posicoes]))
+
+
+class VersaoDados:
+    """
+    Uma versão completa e imutável dos dados: DataFrame, cubo, índice de filtros e
+    ordenação de preços construídos juntos a partir do mesmo estado do CSV.
+
+    Uma sessão pega `DadosCompra.atual` uma vez por rerun e usa só essa versão, então
+    nunca mistura, por exemplo, o `df` novo com o índice antigo. Sem `cubo` (ver
+    `DadosCompra(com_cubo=False)`) o cubo só é montado se alguém o acessar.
+    """
+
+    def __init__(self, numero, caminho_csv, df, meta, cubo, indice, precos_ordenados, anexo_desde=None):
+        self.numero = numero
+        self.caminho_csv = caminho_csv
+        self.df = df
+        self.meta = meta
+        self._cubo = cubo
+        self._lock_cubo = threading.Lock()
+        self.indice = indice
+        self.precos_ordenados = precos_ordenados
+        self.pendentes = PedidosPendentes(df, indice['situacao pedido'].get('pendente', np.empty(0, dtype=np.intp)))
+        # Quando a versão só anexou linhas à anterior, as linhas novas começam nesta posição.
+        self.anexo_desde = anexo_desde
+        self.carregado_em = datetime.now()
+        self.arquivo_modificado_em = datetime.fromtimestamp(meta['mtime_ns'] / 1e9)
+
+    @property
+    def cubo(self):
+        if self._cubo is None:
+            with self._lock_cubo:
+                if self._cubo is None:
+                    cubo = CuboCompra()
+                    cubo.atualizar(self.df)
+                    self._cubo = cubo
+        return self._cubo
+
+
+def _csv_mais_recente(diretorio):
+    arquivos = [entrada for entrada in os.scandir(diretorio) if entrada.is_file() and entrada.name.endswith('.csv')]
+    if not arquivos:
+        raise FileNotFoundError(f"Nenhum CSV em '{diretorio}'.")
+    return max(arquivos, key=lambda entrada: (entrada.stat().st_mtime_ns, entrada.name)).path
+
+
+class DadosCompra:
+    """
+    Conjunto de dados em memória com ingestão incremental do CSV de compras.
+
+    `atualizar` compara tamanho e mtime do CSV com o último estado ingerido. Se o
+    arquivo só cresceu no final, lê apenas as linhas novas, anexa ao DataFrame e
+    atualiza o cubo e o índice de filtros com esse delta; qualquer outra mudança
+    recarrega tudo.
+
+    Tudo é montado numa `VersaoDados` nova que só então é publicada em `atual` (uma
+    única atribuição), então quem já está usando a versão anterior continua com ela
+    inteira. `caminho_csv` pode ser um diretório de exportações: vale o CSV mais
+    recente. `iniciar_monitor` faz as atualizações numa thread em segundo plano.
+    Funções registradas com `ao_publicar` recebem cada versão nova antes de ela ser
+    publicada (por exemplo, para gravar as partições do backend DuckDB).
+
+    `df` fica com tipos compactos (ver `compactar_tipos`) e é compartilhado por todas
+    as sessões do processo: deve ser tratado como somente leitura, e cada atualização
+    troca o objeto em vez de alterá-lo.
+
+    Com `com_cubo=False` (quando os cards e gráficos vêm do backend DuckDB) o cubo não
+    é montado nem atualizado a cada versão; `VersaoDados.cubo` o monta só se for
+    acessado, por exemplo no fallback de uma versão que o backend não sincronizou.
+    """
+
+    def __init__(self, caminho_csv=CAMINHO_CSV, diretorio_cache=DIRETORIO_CACHE, com_cubo=True):
+        self.caminho_csv = caminho_csv
+        self.diretorio_cache = diretorio_cache
+        self.com_cubo = com_cubo
+        self.atual = None
+        self.ultimo_erro = None
+        self._modelo = None
+        self._monitor = None
+        self._ao_publicar = []
+        self._lock = threading.Lock()
+
+    # Atalhos para a versão atual; quem lê mais de um atributo deve usar `atual`.
+    df = property(lambda self: self.atual.df if self.atual else None)
+    meta = property(lambda self: self.atual.meta if self.atual else None)
+    cubo = property(lambda self: self.atual.cubo if self.atual else None)
+    indice = property(lambda self: self.atual.indice if self.atual else None)
+    precos_ordenados = property(lambda self: self.atual.precos_ordenados if self.atual else None)
+
+    def ao_publicar(self, funcao):
+        """Registra `funcao(nova_versao, versao_anterior)`, chamada antes de cada publicação."""
+        self._ao_publicar.append(funcao)
+
+    def resolver_csv(self):
+        """Caminho do CSV a ingerir (o mais recente, se `caminho_csv` for um diretório)."""
+        if os.path.isdir(self.caminho_csv):
+            return _csv_mais_recente(self.caminho_csv)
+        return self.caminho_csv
+
+    @cronometrado
+    def atualizar(self):
+        """Sincroniza com o CSV. Retorna True se uma nova versão foi publicada."""
+        with self._lock:
+            caminho = self.resolver_csv()
+            stat = os.stat(caminho)
+            atual = self.atual
+            mesmo_arquivo = atual is not None and atual.caminho_csv == caminho
+            if mesmo_arquivo and (atual.meta['tamanho'], atual.meta['mtime_ns']) == (stat.st_size, stat.st_mtime_ns):
+                return False
+
+            if mesmo_arquivo and _e_anexo(caminho, atual.meta, stat.st_size):
+                # O snapshot guarda os tipos do CSV; a compactação vale só para a memória.
+                df_delta = _alinhar_tipos(_ler_trecho_csv(caminho, atual.meta['tamanho'], stat.st_size), self._modelo)
+                diretorio_partes, caminho_meta = _caminhos_cache(caminho, self.diretorio_cache)
+                meta = _anexar_ao_snapshot(caminho, diretorio_partes, caminho_meta, atual.meta, df_delta, stat)
+                df_delta = compactar_tipos(_adicionar_colunas_derivadas(df_delta))
+                df = _concatenar_compacto(atual.df, df_delta)
+                cubo = None
+                if self.com_cubo:
+                    # `CuboCompra.atualizar` troca os arrays em vez de alterá-los: a cópia rasa
+                    # deixa o cubo da versão anterior intacto.
+                    cubo = copy.copy(atual.cubo)
+                    cubo.atualizar(df_delta)
+                anexo_desde = len(atual.df)
+                indice = estender_indice_filtros(atual.indice, df_delta, anexo_desde)
+                precos_ordenados = estender_ordem_precos(atual.precos_ordenados, df, anexo_desde)
+            else:
+                df, meta = _carregar_snapshot(caminho, self.diretorio_cache)
+                self._modelo = df.iloc[:0].copy()
+                df = compactar_tipos(_adicionar_colunas_derivadas(df))
+                cubo = None
+                if self.com_cubo:
+                    cubo = CuboCompra()
+                    cubo.atualizar(df)
+                anexo_desde = None
+                indice = construir_indice_filtros(df)
+                precos_ordenados = ordenar_precos(df)
+
+            nova = VersaoDados(atual.numero + 1 if atual else 1, caminho, df, meta, cubo,
+                               indice, precos_ordenados, anexo_desde)
+            for funcao in self._ao_publicar:
+                try:
+                    funcao(nova, atual)
+                except Exception as erro:
+                    # Um consumidor com problema não impede a publicação dos dados.
+                    print(f"Erro ao preparar a versão {nova.numero} dos dados: {erro}")
+            self.atual = nova
+            self.ultimo_erro = None
+            if atual is not None and not mesmo_arquivo:
+                # Outro CSV assumiu (ex.: exportação nova no diretório): o snapshot do
+                # anterior não será mais lido e, como as exportações são cumulativas,
+                # mantê-lo faria o cache crescer sem limite.
+                if _caminhos_cache(atual.caminho_csv, self.diretorio_cache) != _caminhos_cache(caminho, self.diretorio_cache):
+                    _remover_snapshot(atual.caminho_csv, self.diretorio_cache)
+            return True
+
+    def iniciar_monitor(self, intervalo=5.0):
+        """Começa a observar o CSV em segundo plano (uma vez por instância)."""
+        if self._monitor is None:
+            self._monitor = MonitorDados(self, intervalo)
+            self._monitor.start()
+        return self._monitor
+
+    def parar_monitor(self):
+        if self._monitor is not None:
+            self._monitor.parar()
+            self._monitor = None
+
+
+class MonitorDados(threading.Thread):
+    """
+    Thread daemon que consulta o CSV a cada `intervalo` segundos e chama
+    `DadosCompra.atualizar` quando ele mudou.
+
+    A atualização só roda quando tamanho e mtime ficam iguais em duas consultas
+    seguidas, para não ler um arquivo que o exportador ainda está gravando. Erros
+    ficam em `dados.ultimo_erro` e a versão anterior continua publicada.
+    """
+
+    def __init__(self, dados, intervalo=5.0):
+        super().__init__(name='monitor-dados-compra', daemon=True)
+        self.dados = dados
+        self.intervalo = intervalo
+        self._parar = threading.Event()
+
+    def _assinatura(self):
+        caminho = self.dados.resolver_csv()
+        stat = os.stat(caminho)
+        return caminho, stat.st_size, stat.st_mtime_ns
+
+    def run(self):
+        anterior = None
+        while not self._parar.wait(self.intervalo):
+            try:
+                assinatura = self._assinatura()
+            except OSError:
+                anterior = None
+                continue
+            atual = self.dados.atual
+            carregada = atual and (atual.caminho_csv, atual.meta['tamanho'], atual.meta['mtime_ns'])
+            if assinatura == anterior and assinatura != carregada:
+                try:
+                    self.dados.atualizar()
+                except Exception as erro:
+                    self.dados.ultimo_erro = erro
+                    print(f"Erro ao atualizar os dados de compra em segundo plano: {erro}")
+            anterior = assinatura
+
+    def parar(self):
+        self._parar.set()
+
+
+JANELAS_DIAS = (30, 90, 180, 365)
+ROTULOS_CADENCIA = {'descricao produto': 'Produto', 'fornecedor': 'Fornecedor'}
+
+
+@cronometrado
+def calcular_cadencia_compras(df, chave='descricao produto', janelas=JANELAS_DIAS, hoje=None):
+    """
+    Calcula a cadência de reposição (intervalo entre compras) por produto ou fornecedor
+    em várias janelas de uma vez.
+
+    As compras da maior janela são ordenadas uma única vez por (código inteiro da
+    chave, data emissao) e os intervalos saem de um `np.diff`. Cada janela é só uma
+    máscara sobre esses arrays; as somas usam `np.bincount` e as medianas de todas as
+    janelas saem de uma única ordenação dos intervalos.
+
+    Args:
+        df (pd.DataFrame): Dados com 'data emissao' e a coluna `chave`.
+        chave (str): Coluna de agrupamento ('descricao produto' ou 'fornecedor').
+        janelas (tuple): Tamanhos das janelas em dias, contados a partir de `hoje`.
+        hoje (datetime): Data de referência; padrão `datetime.now()`.
+
+    Returns:
+        pd.DataFrame: Uma linha por (janela, chave) com compras na janela e as colunas
+                      'Janela (dias)', 'Produto'/'Fornecedor', 'Prazo Médio de Compra (dias)'
+                      (0 com uma compra só), 'Prazo Mediano (dias)' e 'Variância do Prazo'
+                      (vazios sem intervalos suficientes) e 'Frequência de Compra'.
+    """
+    rotulo = ROTULOS_CADENCIA.get(chave, chave)
+    colunas = ['Janela (dias)', rotulo, 'Prazo Médio de Compra (dias)', 'Prazo Mediano (dias)',
+               'Variância do Prazo', 'Frequência de Compra']
+    hoje = hoje or datetime.now()
+    limites = [np.datetime64(hoje - timedelta(days=dias), 'ns') for dias in janelas]
+
+    datas = df['data emissao'].to_numpy(dtype='datetime64[ns]')
+    valido = (datas >= min(limites)) & df[chave].notna().to_numpy()
+    if not valido.any():
+        return pd.DataFrame(columns=colunas)
+    codigos, valores = pd.factorize(df[chave].to_numpy()[valido], sort=True)
+    datas = datas[valido]
+    ordem = np.lexsort((datas, codigos))
+    codigos, datas = codigos[ordem], datas[ordem]
+
+    mesmo_grupo = codigos[1:] == codigos[:-1]
+    intervalos = np.diff(datas.astype('datetime64[D]').astype(np.int64))[mesmo_grupo].astype(float)
+    codigo_intervalo = codigos[1:][mesmo_grupo]
+    data_anterior = datas[:-1][mesmo_grupo]
+
+    n_chaves = len(valores)
+    n_janelas = len(janelas)
+    frequencia = np.empty((n_janelas, n_chaves), dtype=np.int64)
+    chaves_intervalo, valores_intervalo = [], []
+    for j, limite in enumerate(limites):
+        frequencia[j] = np.bincount(codigos[datas >= limite], minlength=n_chaves)
+        # O intervalo entra na janela quando a compra anterior também está nela.
+        na_janela = data_anterior >= limite
+        chaves_intervalo.append(j * n_chaves + codigo_intervalo[na_janela])
+        valores_intervalo.append(intervalos[na_janela])
+    chaves_intervalo = np.concatenate(chaves_intervalo)
+    valores_intervalo = np.concatenate(valores_intervalo)
+
+    tamanho = n_janelas * n_chaves
+    n = np.bincount(chaves_intervalo, minlength=tamanho)
+    soma = np.bincount(chaves_intervalo, weights=valores_intervalo, minlength=tamanho)
+    soma_quadrados = np.bincount(chaves_intervalo, weights=valores_intervalo ** 2, minlength=tamanho)
+
+    ordem = np.lexsort((valores_intervalo, chaves_intervalo))
+    ordenados = valores_intervalo[ordem]
+    inicio = np.concatenate(([0], np.cumsum(n)[:-1]))
+    tem_intervalo = n > 0
+    mediana = np.full(tamanho, np.nan)
+    meio_baixo = inicio[tem_intervalo] + (n[tem_intervalo] - 1) // 2
+    meio_alto = inicio[tem_intervalo] + n[tem_intervalo] // 2
+    mediana[tem_intervalo] = (ordenados[meio_baixo] + ordenados[meio_alto]) / 2
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        media = np.where(tem_intervalo, soma / n, 0.0)
+        variancia = np.where(n > 1, (soma_quadrados - soma ** 2 / n) / (n - 1), np.nan)
+
+    frequencia = frequencia.ravel()
+    com_compra = frequencia > 0
+    janela_linha = np.repeat(np.asarray(janelas), n_chaves)
+    return pd.DataFrame({
+        'Janela (dias)': janela_linha[com_compra],
+        rotulo: np.tile(np.asarray(valores), n_janelas)[com_compra],
+        'Prazo Médio de Compra (dias)': media[com_compra].round(2),
+        'Prazo Mediano (dias)': mediana[com_compra],
+        'Variância do Prazo': variancia[com_compra].round(2),
+        'Frequência de Compra': frequencia[com_compra],
+    }, columns=colunas)
+
+
+def calcular_prazo_medio_e_frequencia(df):
+    """Prazo médio e frequência de compra por produto nos últimos 90 dias."""
+    cadencia = calcular_cadencia_compras(df, janelas=(90,))
+    return cadencia[['Produto', 'Prazo Médio de Compra (dias)', 'Frequência de Compra']].reset_index(drop=True)
+
+
+def _codigos_produto(df):
+    # Código de `pd.factorize(..., sort=True)` do produto em cada linha; -1 nas linhas sem
+    # produto, data ou preço, que ficam fora da análise de preços.
+    validas = df[['descricao produto', 'data emissao', 'preco unitario liquido item']].notna().all(axis=1).to_numpy()
+    codigos, produtos = pd.factorize(df['descricao produto'][validas], sort=True)
+    codigo_linha = np.full(len(df), -1, dtype=np.intp)
+    codigo_linha[validas] = codigos
+    return codigo_linha, produtos
+
+
+def _ordenar_linhas(linhas, codigo_linha, datas, precos):
+    # `linhas` em ordem crescente: o lexsort é estável, então empates seguem a ordem do df.
+    return linhas[np.lexsort((precos[linhas], -datas[linhas].astype(np.int64), codigo_linha[linhas]))]
+
+
+def _posicoes_extremos(codigos, precos, posicoes):
+    # Posição do menor/maior preço visto até cada linha do bloco; empates ficam com a
+    # compra mais recente porque só desigualdade estrita atualiza a posição.
+    serie = pd.Series(precos)
+    grupos = serie.groupby(codigos)
+    minimo_anterior = grupos.cummin().groupby(codigos).shift()
+    maximo_anterior = grupos.cummax().groupby(codigos).shift()
+    novo_minimo = (minimo_anterior.isna() | (serie < minimo_anterior)).to_numpy()
+    novo_maximo = (maximo_anterior.isna() | (serie > maximo_anterior)).to_numpy()
+    pos_minimo = pd.Series(np.where(novo_minimo, posicoes, -1)).groupby(codigos).cummax().to_numpy()
+    pos_maximo = pd.Series(np.where(novo_maximo, posicoes, -1)).groupby(codigos).cummax().to_numpy()
+    return pos_minimo, pos_maximo
+
+
+def _montar_ordem_precos(df, linhas, codigos, produtos, datas, precos, pos_minimo, pos_maximo):
+    datas, precos = datas[linhas], precos[linhas]
+    contagem = np.bincount(codigos, minlength=len(produtos))
+    inicios = np.concatenate(([0], np.cumsum(contagem)[:-1]))
+    # Quantas compras cada produto tem na sua data mais recente (o bloco já começa por ela).
+    n_ultima_data = np.bincount(codigos[datas == datas[inicios[codigos]]], minlength=len(produtos))
+    return {
+        'produtos': produtos, 'codigos': codigos, 'datas': datas, 'precos': precos,
+        'fornecedores': df['fornecedor'].array[linhas], 'inicios': inicios, 'n_ultima_data': n_ultima_data,
+        'pos_minimo': pos_minimo, 'pos_maximo': pos_maximo, 'linhas': linhas,
+    }
+
+
+@cronometrado
+def ordenar_precos(df):
+    """
+    Ordena as compras uma única vez para a análise de preços negociados.
+
+    A ordem é (produto, data emissao decrescente, preço crescente), então as compras
+    de cada produto dentro de qualquer janela "últimos N dias" formam um prefixo
+    do seu bloco. Junto com a ordenação são calculadas as posições do menor e do
+    maior preço acumulados ao longo de cada bloco, o que permite responder qualquer
+    janela sem reordenar.
+
+    Args:
+        df (pd.DataFrame): Dados com 'descricao produto', 'data emissao',
+                           'preco unitario liquido item' e 'fornecedor'.
+
+    Returns:
+        dict: Arrays ordenados e posições pré-calculadas, para `analisar_precos_janela`.
+    """
+    codigo_linha, produtos = _codigos_produto(df)
+    datas = df['data emissao'].to_numpy(dtype='datetime64[ns]')
+    precos = df['preco unitario liquido item'].to_numpy(dtype=float)
+    linhas = _ordenar_linhas(np.flatnonzero(codigo_linha >= 0), codigo_linha, datas, precos)
+    codigos = codigo_linha[linhas]
+    pos_minimo, pos_maximo = _posicoes_extremos(codigos, precos[linhas], np.arange(len(linhas)))
+    return _montar_ordem_precos(df, linhas, codigos, produtos, datas, precos, pos_minimo, pos_maximo)
+
+
+@cronometrado
+def estender_ordem_precos(ordenados, df, inicio):
+    """
+    Resultado de `ordenar_precos(df)` a partir do de `df.iloc[:inicio]`, quando as linhas
+    a partir de `inicio` foram apenas anexadas.
+
+    Só as linhas novas são ordenadas; cada uma é intercalada no bloco do seu produto
+    por busca binária. As posições de menor/maior preço acumulado são apenas
+    remapeadas nos produtos sem compras novas e recalculadas nos demais. O resultado
+    recebido não é alterado (ele pertence à versão anterior).
+    """
+    codigo_linha, produtos = _codigos_produto(df)
+    datas = df['data emissao'].to_numpy(dtype='datetime64[ns]')
+    precos = df['preco unitario liquido item'].to_numpy(dtype=float)
+    linhas_anteriores = ordenados['linhas']
+    codigos_anteriores = codigo_linha[linhas_anteriores]
+    if np.any(codigos_anteriores[1:] < codigos_anteriores[:-1]):
+        # A ordem dos produtos antigos mudou (não acontece com categorias só estendidas).
+        return ordenar_precos(df)
+
+    novas = _ordenar_linhas(np.flatnonzero(codigo_linha[inicio:] >= 0) + inicio, codigo_linha, datas, precos)
+    codigos_novas = codigo_linha[novas]
+    datas_novas = datas[novas].astype(np.int64)
+    precos_novas = precos[novas]
+    # Posição de inserção: depois das compras do mesmo produto com data mais recente, ou
+    # com a mesma data e preço menor ou igual (empates ficam na ordem do df).
+    baixo = np.searchsorted(codigos_anteriores, codigos_novas, side='left')
+    alto = np.searchsorted(codigos_anteriores, codigos_novas, side='right')
+    datas_anteriores = ordenados['datas'].astype(np.int64)
+    precos_anteriores = ordenados['precos']
+    while np.any(pendente := baixo < alto):
+        meio = (baixo + alto) // 2
+        meio_valido = np.where(pendente, meio, 0)
+        data_meio = datas_anteriores[meio_valido]
+        depois = (data_meio < datas_novas) | ((data_meio == datas_novas) & (precos_anteriores[meio_valido] > precos_novas))
+        alto = np.where(pendente & depois, meio, alto)
+        baixo = np.where(pendente & ~depois, meio + 1, baixo)
+
+    destino_novas = baixo + np.arange(len(novas))
+    destino_anteriores = np.arange(len(linhas_anteriores)) + np.cumsum(
+        np.bincount(baixo, minlength=len(linhas_anteriores) + 1))[:len(linhas_anteriores)]
+    linhas = np.empty(len(linhas_anteriores) + len(novas), dtype=np.intp)
+    linhas[destino_anteriores] = linhas_anteriores
+    linhas[destino_novas] = novas
+    codigos = codigo_linha[linhas]
+
+    pos_minimo = np.empty(len(linhas), dtype=np.intp)
+    pos_maximo = np.empty(len(linhas), dtype=np.intp)
+    pos_minimo[destino_anteriores] = destino_anteriores[ordenados['pos_minimo']]
+    pos_maximo[destino_anteriores] = destino_anteriores[ordenados['pos_maximo']]
+    produto_tocado = np.zeros(len(produtos), dtype=bool)
+    produto_tocado[codigos_novas] = True
+    posicoes = np.flatnonzero(produto_tocado[codigos])
+    pos_minimo[posicoes], pos_maximo[posicoes] = _posicoes_extremos(codigos[posicoes], precos[linhas[posicoes]], posicoes)
+    return _montar_ordem_precos(df, linhas, codigos, produtos, datas, precos, pos_minimo, pos_maximo)
+
+
+def analisar_precos_janela(ordenados, dias=90, hoje=None):
+    """
+    Resume, por produto, os preços negociados nos últimos `dias` dias.
+
+    Args:
+        ordenados (dict): Resultado de `ordenar_precos`.
+        dias (int): Tamanho da janela em dias.
+        hoje (datetime): Data de referência da janela; padrão `datetime.now()`.
+
+    Returns:
+        pd.DataFrame: Uma linha por produto comprado na janela com 'Produto',
+                      'Última Compra', 'Menor Preço Recente' e 'Maior Preço Recente'
+                      (na data da última compra), 'Menor Preço', 'Fornecedor Menor Preço',
+                      'Maior Preço' e 'Fornecedor Maior Preço' (na janela toda).
+    """
+    hoje = hoje or datetime.now()
+    limite = np.datetime64(hoje - timedelta(days=dias), 'ns')
+    dentro = ordenados['datas'] >= limite
+    contagem = np.bincount(ordenados['codigos'][dentro], minlength=len(ordenados['produtos']))
+    tem_compra = contagem > 0
+
+    inicio = ordenados['inicios'][tem_compra]
+    fim = inicio + contagem[tem_compra] - 1
+    pos_minimo = ordenados['pos_minimo'][fim]
+    pos_maximo = ordenados['pos_maximo'][fim]
+    precos, fornecedores = ordenados['precos'], ordenados['fornecedores']
+
+    return pd.DataFrame({
+        'Produto': np.asarray(ordenados['produtos'])[tem_compra],
+        'Última Compra': ordenados['datas'][inicio],
+        'Menor Preço Recente': precos[inicio],
+        'Maior Preço Recente': precos[inicio + ordenados['n_ultima_data'][tem_compra] - 1],
+        'Menor Preço': precos[pos_minimo],
+        'Fornecedor Menor Preço': np.asarray(fornecedores[pos_minimo]),
+        'Maior Preço': precos[pos_maximo],
+        'Fornecedor Maior Preço': np.asarray(fornecedores[pos_maximo]),
+    })
+
+
+@cronometrado
+def analisar_melhores_e_piores_negociacoes_precos(ordenados, dias=90, n=10, hoje=None):
+    """
+    Seleciona as `n` melhores (menores preços recentes) e as `n` piores (maiores
+    preços recentes) negociações dos últimos `dias` dias.
+
+    Args:
+        ordenados (dict): Resultado de `ordenar_precos`; trocar `dias` ou `n` não reordena os dados.
+        dias (int): Tamanho da janela em dias.
+        n (int): Quantidade de produtos em cada lista.
+        hoje (datetime): Data de referência da janela; padrão `datetime.now()`.
+
+    Returns:
+        tuple: (df_melhores, df_piores), com 'Produto' e 'Preço Unitário' (preço da
+               compra mais recente) e o menor/maior preço da janela com seu fornecedor.
+    """
+    resumo = analisar_precos_janela(ordenados, dias, hoje)
+    df_melhores = resumo.sort_values('Menor Preço Recente', kind='stable').head(n)
+    df_melhores = df_melhores[['Produto', 'Menor Preço Recente', 'Menor Preço', 'Fornecedor Menor Preço']].rename(
+        columns={'Menor Preço Recente': 'Preço Unitário'})
+    df_piores = resumo.sort_values('Maior Preço Recente', ascending=False, kind='stable').head(n)
+    df_piores = df_piores[['Produto', 'Maior Preço Recente', 'Maior Preço', 'Fornecedor Maior Preço']].rename(
+        columns={'Maior Preço Recente': 'Preço Unitário'})
+    return df_melhores, df_piores
+
+
+def analisar_melhores_e_piores_negociacoes_precos_ultimos_90_dias(df):
+    """
+    Analisa os 10 melhores (menores preços de compra) e os 10 piores (maiores preços de compra)
+    negociações nos últimos 90 dias.
+
+    Atalho para `analisar_melhores_e_piores_negociacoes_precos(ordenar_precos(df), 90, 10)`.
+    """
+    return analisar_melhores_e_piores_negociacoes_precos(ordenar_precos(df), dias=90, n=10)
+
+
+
+def formatar_moeda(valor, simbolo_moeda='R$'):
+    try:
+        valor = float(valor)
+        return f"{simbolo_moeda} {valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+    except (ValueError, TypeError):
+        return f"{simbolo_moeda} 0,00"
+
+
+# Acima disso (2**53 centavos) `x * 100` já não é exato em float.
+MAXIMO_CENTAVOS_VETORIZADO = 2 ** 53
+
+
+def _texto_com_zeros(inteiros, largura):
+    return pc.utf8_lpad(pc.cast(pa.array(inteiros), pa.string()), width=largura, padding='0')
+
+
+@cronometrado
+def formatar_moeda_serie(valores, simbolo_moeda='R$'):
+    """
+    Versão vetorizada de `formatar_moeda` para uma coluna inteira, com o mesmo texto
+    elemento a elemento.
+
+    Trabalha em centavos inteiros e monta os grupos de milhar com kernels de texto
+    do pyarrow, sem `float`/`str.replace` por elemento. Os poucos valores que o
+    caminho vetorizado não reproduz exatamente vão para `formatar_moeda`/`format`:
+    os não finitos ou não numéricos ("R$ nan", "R$ 0,00"...), os grandes demais para
+    centavos em int64 e os a menos de um arredondamento de meio centavo, em que
+    `x * 100` pode cair do outro lado do empate que `format` decide pelo valor exato.
+    """
+    serie = pd.Series(valores)
+    numeros = pd.to_numeric(serie, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    with np.errstate(invalid='ignore', over='ignore'):
+        escalado = numeros * 100
+        fora_do_vetorizado = ~(np.abs(escalado) < MAXIMO_CENTAVOS_VETORIZADO)
+        escalado[fora_do_vetorizado] = 0
+        fracao = np.abs(escalado - np.floor(escalado) - 0.5)
+        empate = fracao <= np.maximum(1e-6, np.abs(escalado) * 1e-14)
+    centavos = np.round(escalado).astype(np.int64)
+    for posicao in np.flatnonzero(empate & ~fora_do_vetorizado):
+        centavos[posicao] = int(format(numeros[posicao], '.2f').replace('.', ''))
+    negativo = np.signbit(numeros)
+    centavos = np.abs(centavos)
+    inteiro = centavos // 100
+
+    # Todos os grupos com 3 dígitos ("001.234.567"); depois remove zeros e pontos à esquerda.
+    texto = _texto_com_zeros(inteiro % 1000, 3)
+    resto = inteiro // 1000
+    while (resto > 0).any():
+        texto = pc.binary_join_element_wise(_texto_com_zeros(resto % 1000, 3), texto, '.')
+        resto //= 1000
+    texto = pc.utf8_ltrim(texto, characters='0.')
+    texto = pc.if_else(pc.equal(texto, ''), '0', texto)
+
+    prefixo = pa.array(np.where(negativo, f'{simbolo_moeda} -', f'{simbolo_moeda} '))
+    texto = pc.binary_join_element_wise(pc.binary_join_element_wise(prefixo, texto, ''),
+                                        _texto_com_zeros(centavos % 100, 2), ',')
+    resultado = texto.to_numpy(zero_copy_only=False)
+    for posicao in np.flatnonzero(fora_do_vetorizado):
+        resultado[posicao] = formatar_moeda(serie.iat[posicao], simbolo_moeda)
+    return pd.Series(resultado, index=serie.index)
+
+
+def _adicionar_colunas_derivadas(df):
+    df['mes_nome'] = df['mes'].map(meses_abreviados_num_para_abv)
+    return df
+
+
+def _posicoes_por_valor(serie):
+    codigos, valores = pd.factorize(serie)
+    ordem = np.argsort(codigos, kind='stable')
+    # Valores nulos recebem código -1 e ficam no início da ordenação; nenhum filtro os seleciona.
+    ordem = ordem[np.count_nonzero(codigos < 0):]
+    contagens = np.bincount(codigos[codigos >= 0], minlength=len(valores))
+    return dict(zip(valores.tolist(), np.split(ordem, np.cumsum(contagens)[:-1])))
+
+
+@cronometrado
+def construir_indice_filtros(df):
+    """
+    Monta, para cada dimensão de filtro, as posições de linha (ordenadas) de cada valor.
+
+    Returns:
+        dict: {coluna: {valor: np.ndarray de posições}} para 'ano', 'mes', 'usuario',
+              'situacao pedido' e 'tipo fornecedor'.
+    """
+    return {coluna: _posicoes_por_valor(df[coluna])
+            for coluna in ['ano', 'mes', 'usuario', 'situacao pedido', 'tipo fornecedor']}
+
+
+@cronometrado
+def estender_indice_filtros(indice, df_delta, inicio):
+    """
+    Índice de `construir_indice_filtros` depois de anexar `df_delta` a partir da linha `inicio`.
+
+    As linhas novas têm todas posição >= `inicio`, então basta concatenar as posições
+    do delta ao fim das de cada valor: as listas continuam ordenadas. O índice
+    recebido não é alterado (ele pertence à versão anterior).
+    """
+    novo = {}
+    for coluna, posicoes_por_valor in indice.items():
+        posicoes_por_valor = dict(posicoes_por_valor)
+        for valor, posicoes in _posicoes_por_valor(df_delta[coluna]).items():
+            anteriores = posicoes_por_valor.get(valor)
+            posicoes = posicoes + inicio
+            posicoes_por_valor[valor] = posicoes if anteriores is None else np.concatenate([anteriores, posicoes])
+        novo[coluna] = posicoes_por_valor
+    return novo
+
+
+def _resolver_filtros(ano='todos', mes='todos', usuario='todos', situacao='todos', tipo_fornecedor='todos'):
+    """
+    Traduz os valores dos seletores em {coluna: valor} com a mesma semântica de
+    `aplicar_filtros` ('todos' no ano significa o ano atual). Também indica se o
+    mês informado não foi reconhecido (nesse caso o mês não é filtrado).
+    """
+    meses_abreviados_abv_para_num = {v: k for k, v in meses_abreviados_num_para_abv.items()}
+    filtros = {'ano': datetime.now().year if ano == 'todos' else int(ano)}
+    mes_invalido = False
+    if mes != 'todos':
+        if mes in meses_abreviados_abv_para_num:
+            filtros['mes'] = meses_abreviados_abv_para_num[mes]
+        elif isinstance(mes, int):
+            filtros['mes'] = mes
+        else:
+            mes_invalido = True
+    for coluna, valor in [('usuario', usuario), ('situacao pedido', situacao), ('tipo fornecedor', tipo_fornecedor)]:
+        if valor != 'todos':
+            filtros[coluna] = valor
+    return filtros, mes_invalido
+
+
+def _aplicar_filtros_indice(df, indice, ano, mes, usuario, situacao, tipo_fornecedor):
+    vazio = np.empty(0, dtype=np.intp)
+    filtros, mes_invalido = _resolver_filtros(ano, mes, usuario, situacao, tipo_fornecedor)
+    selecoes = [indice[coluna].get(valor, vazio) for coluna, valor in filtros.items()]
+
+    # Interseção começando pela menor lista; as posições continuam ordenadas,
+    # então o resultado mantém a ordem original das linhas.
+    selecoes.sort(key=len)
+    posicoes = selecoes[0]
+    for outras in selecoes[1:]:
+        if len(posicoes) == 0:
+            break
+        posicoes = np.intersect1d(posicoes, outras, assume_unique=True)
+
+    df_filtrado = df.take(posicoes)
+    if mes_invalido:
+        df_filtrado['mes_nome'] = None
+    return df_filtrado
+
+
+@cronometrado
+def aplicar_filtros(df, ano='todos', mes='todos', usuario='todos', situacao='todos', tipo_fornecedor='todos', indice=None):
+    """
+    Filtra o DataFrame de compras. Com `indice` (ver `construir_indice_filtros`) os
+    filtros são resolvidos por interseção de posições e só as linhas selecionadas
+    são copiadas; `df` precisa então já ter a coluna 'mes_nome'.
+    """
+    if indice is not None:
+        return _aplicar_filtros_indice(df, indice, ano, mes, usuario, situacao, tipo_fornecedor)
+
+    ano_atual = datetime.now().year
+    meses_abreviados_num_para_abv = {
+        1: 'Jan', 2: 'Fev', 3: 'Mar', 4: 'Abr', 5: 'Mai', 6: 'Jun',
+        7: 'Jul', 8: 'Ago', 9: 'Set', 10: 'Out', 11: 'Nov', 12: 'Dez'
+    }
+    meses_abreviados_abv_para_num = {v: k for k, v in meses_abreviados_num_para_abv.items()}
+
+    # O ano é sempre filtrado, então só o recorte do ano é copiado (e não o df inteiro).
+    if ano == 'todos':
+        df_filtrado = df[df['ano'] == ano_atual].copy()
+    elif ano != 'todos':
+        df_filtrado = df[df['ano'] == int(ano)].copy()
+
+    if mes == 'todos':
+        df_filtrado['mes_nome'] = df_filtrado['mes'].map(meses_abreviados_num_para_abv)
+    elif mes != 'todos':
+        if mes in meses_abreviados_abv_para_num:
+            df_filtrado = df_filtrado[df_filtrado['mes'] == meses_abreviados_abv_para_num[mes]]
+            df_filtrado['mes_nome'] = mes
+        elif isinstance(mes, int):
+            df_filtrado = df_filtrado[df_filtrado['mes'] == mes]
+            df_filtrado['mes_nome'] = meses_abreviados_num_para_abv.get(mes)
+        else:
+            df_filtrado['mes_nome'] = None  
+
+    if usuario != 'todos':
+        df_filtrado = df_filtrado[df_filtrado['usuario'] == usuario]
+
+    if situacao != 'todos':
+        df_filtrado = df_filtrado[df_filtrado['situacao pedido'] == situacao]
+
+    if tipo_fornecedor != 'todos':
+        df_filtrado = df_filtrado[df_filtrado['tipo fornecedor'] == tipo_fornecedor]
+
+    return df_filtrado
+
+
+@cronometrado
+def calcular_metricas(df):
+    qunatidade_total_pedidos = df['numeropedido'].nunique()
+    valor_total_pedidos = df['valor liquido item'].sum()
+    quantidade_total_itens = df['qtd pedido item'].sum()
+    quantidade_pedidos_entregues = df[df['situacao pedido'] == 'fechado pedido chegou']['numeropedido'].nunique()
+    quantidade_pedidos_pendentes = df[df['situacao pedido'] == 'pendente']['numeropedido'].nunique()
+    return qunatidade_total_pedidos, valor_total_pedidos, quantidade_total_itens, quantidade_pedidos_entregues, quantidade_pedidos_pendentes
+
+
+MODOS_COMPARACAO = {
+    'Mês anterior': (1, 1),
+    'Mesmo mês do ano anterior': (1, 12),
+    'Últimos 3 meses vs 3 anteriores': (3, 3),
+}
+
+
+def _rotulo_periodo(meses):
+    (ano_ini, mes_ini), (ano_fim, mes_fim) = meses[0], meses[-1]
+    if (ano_ini, mes_ini) == (ano_fim, mes_fim):
+        return f'{mes_fim}/{ano_fim}'
+    return f'{mes_ini}/{ano_ini}-{mes_fim}/{ano_fim}'
+
+
+def periodos_comparacao(ano, mes, modo):
+    """
+    Monta os dois períodos de um modo de `MODOS_COMPARACAO` terminando em (ano, mes).
+
+    Returns:
+        list: [(rotulo, [(ano, mes), ...]), ...] em ordem cronológica.
+    """
+    tamanho, deslocamento = MODOS_COMPARACAO[modo]
+    fim = ano * 12 + mes - 1
+    periodos = []
+    for final in (fim - deslocamento, fim):
+        meses = [divmod(chave, 12) for chave in range(final - tamanho + 1, final + 1)]
+        meses = [(a, m + 1) for a, m in meses]
+        periodos.append((_rotulo_periodo(meses), meses))
+    return periodos
+
+
+def linhas_para_comparacao(df, filtros, periodos):
+    """
+    Linhas de `df` nos meses de `periodos` que atendem aos filtros de usuário, situação
+    e tipo de fornecedor. Os filtros de ano e mês são ignorados: eles definem só o mês
+    de referência, e os períodos anteriores a ele ficariam de fora.
+
+    Args:
+        df (pd.DataFrame): Dados de compra.
+        filtros (dict): Argumentos de `aplicar_filtros`.
+        periodos (list): Resultado de `periodos_comparacao`.
+
+    Returns:
+        pd.DataFrame: As linhas selecionadas, na ordem original.
+    """
+    colunas, _ = _resolver_filtros(**filtros)
+    chaves_mes = df['ano'].to_numpy(dtype=np.int64) * 12 + df['mes'].to_numpy(dtype=np.int64) - 1
+    mascara = np.isin(chaves_mes, [a * 12 + m - 1 for _, meses in periodos for a, m in meses])
+    for coluna, valor in colunas.items():
+        if coluna not in ('ano', 'mes'):
+            mascara &= (df[coluna] == valor).to_numpy()
+    return df[mascara]
+
+
+def _variacao_percentual(preco_anterior, preco_atual):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variacao = (preco_atual - preco_anterior) / preco_anterior * 100
+    return np.where((preco_anterior == 0) | (preco_atual == 0), 0.0, variacao)
+
+
+@cronometrado
+def comparar_periodos(df, periodos):
+    """
+    Compara preço unitário médio e quantidade comprada por produto em N períodos.
+
+    Cada linha é atribuída ao seu período por uma tabela de consulta (ano, mes) e
+    as somas saem de um único `np.bincount` sobre (produto, período), sem groupbys
+    nem merges por período. Os períodos não podem se sobrepor.
+
+    Args:
+        df (pd.DataFrame): Dados com 'ano', 'mes', 'descricao produto',
+                           'preco unitario liquido item' e 'qtd pedido item'.
+        periodos (list): [(rotulo, [(ano, mes), ...]), ...] em ordem cronológica,
+                         como devolvido por `periodos_comparacao`.
+
+    Returns:
+        pd.DataFrame: Uma linha por produto com 'Quantidade <período>' e
+                      'Preço Unitário <período>' de cada período (0 quando não houve
+                      compra) e 'Variação Preço Unitário (%)' entre os dois últimos
+                      períodos. Com mais de dois períodos, cada par consecutivo anterior
+                      ganha uma coluna 'Variação Preço Unitário <a> → <b> (%)'.
+    """
+    n_periodos = len(periodos)
+    chaves_mes = df['ano'].to_numpy(dtype=np.int64) * 12 + df['mes'].to_numpy(dtype=np.int64) - 1
+    minimo = min(a * 12 + m - 1 for _, meses in periodos for a, m in meses)
+    maximo = max(a * 12 + m - 1 for _, meses in periodos for a, m in meses)
+    consulta = np.full(maximo - minimo + 1, -1, dtype=np.int64)
+    for i, (_, meses) in enumerate(periodos):
+        for a, m in meses:
+            consulta[a * 12 + m - 1 - minimo] = i
+
+    dentro = (chaves_mes >= minimo) & (chaves_mes <= maximo)
+    periodo_linha = np.full(len(df), -1, dtype=np.int64)
+    periodo_linha[dentro] = consulta[chaves_mes[dentro] - minimo]
+    selecionadas = periodo_linha >= 0
+
+    codigos, produtos = pd.factorize(df['descricao produto'].to_numpy()[selecionadas], sort=True)
+    precos = df['preco unitario liquido item'].to_numpy(dtype=float)[selecionadas]
+    quantidades = df['qtd pedido item'].to_numpy(dtype=float)[selecionadas]
+    validos = codigos >= 0
+    chave = codigos[validos] * n_periodos + periodo_linha[selecionadas][validos]
+    tamanho = len(produtos) * n_periodos
+    precos, quantidades = precos[validos], quantidades[validos]
+
+    preco_ok = ~np.isnan(precos)
+    soma_preco = np.bincount(chave[preco_ok], weights=precos[preco_ok], minlength=tamanho).reshape(-1, n_periodos)
+    contagem_preco = np.bincount(chave[preco_ok], minlength=tamanho).reshape(-1, n_periodos)
+    soma_qtd = np.bincount(chave, weights=np.nan_to_num(quantidades), minlength=tamanho).reshape(-1, n_periodos)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        preco_medio = np.where(contagem_preco > 0, soma_preco / contagem_preco, 0.0)
+
+    rotulos = [rotulo for rotulo, _ in periodos]
+    resultado = {'descricao produto': produtos}
+    for i, rotulo in enumerate(rotulos):
+        resultado[f'Quantidade {rotulo}'] = soma_qtd[:, i]
+    for i, rotulo in enumerate(rotulos):
+        resultado[f'Preço Unitário {rotulo}'] = preco_medio[:, i]
+    for i in range(1, n_periodos - 1):
+        resultado[f'Variação Preço Unitário {rotulos[i - 1]} → {rotulos[i]} (%)'] = _variacao_percentual(preco_medio[:, i - 1], preco_medio[:, i])
+    if n_periodos > 1:
+        resultado['Variação Preço Unitário (%)'] = _variacao_percentual(preco_medio[:, -2], preco_medio[:, -1])
+    return pd.DataFrame(resultado)
+
+
+NOMES_METRICAS = ['QTD Pedidos', 'Valor Total', 'QTD Itens', 'Pedidos Recebidos', 'Pedidos Pendentes']
+
+
+@cronometrado
+def gerar_relatorios(df, filtros, indice=None, modo_comparacao='Mês anterior', janelas=JANELAS_DIAS,
+                     dias_precos=90, n_precos=10, hoje=None):
+    """
+    Gera as tabelas do painel para uma combinação de filtros, sem Streamlit.
+
+    Todas as análises são feitas sobre a seleção de `aplicar_filtros`, exceto o
+    comparativo: ele usa o último mês presente na seleção como referência, mas busca
+    os meses comparados em todo `df` (ver `linhas_para_comparacao`), já que o período
+    anterior em geral fica fora do recorte de ano e mês.
+
+    Args:
+        df (pd.DataFrame): Dados de compra (com 'mes_nome' quando `indice` é informado).
+        filtros (dict): Argumentos de `aplicar_filtros` (ano, mes, usuario, situacao, tipo_fornecedor).
+        indice (dict): Índice de `construir_indice_filtros` para `df`, opcional.
+        modo_comparacao (str): Chave de `MODOS_COMPARACAO`.
+        janelas (tuple): Janelas em dias da análise de cadência.
+        dias_precos (int): Janela em dias da análise de melhores e piores preços.
+        n_precos (int): Quantidade de produtos em cada lista de preços.
+        hoje (datetime): Data de referência das janelas; padrão `datetime.now()`.
+
+    Returns:
+        dict: {nome: pd.DataFrame} com 'metricas', 'comparativo', 'cadencia_produto',
+              'cadencia_fornecedor', 'melhores_precos' e 'piores_precos'.
+    """
+    df_filtrado = aplicar_filtros(df, indice=indice, **filtros)
+    relatorios = {'metricas': pd.DataFrame([dict(zip(NOMES_METRICAS, calcular_metricas(df_filtrado)))])}
+
+    if df_filtrado.empty:
+        relatorios['comparativo'] = pd.DataFrame(columns=['descricao produto', 'Variação Preço Unitário (%)'])
+    else:
+        ano_referencia = int(df_filtrado['ano'].max())
+        mes_referencia = int(df_filtrado.loc[df_filtrado['ano'] == ano_referencia, 'mes'].max())
+        periodos = periodos_comparacao(ano_referencia, mes_referencia, modo_comparacao)
+        relatorios['comparativo'] = comparar_periodos(linhas_para_comparacao(df, filtros, periodos), periodos)
+
+    relatorios['cadencia_produto'] = calcular_cadencia_compras(df_filtrado, 'descricao produto', janelas, hoje)
+    relatorios['cadencia_fornecedor'] = calcular_cadencia_compras(df_filtrado, 'fornecedor', janelas, hoje)
+    relatorios['melhores_precos'], relatorios['piores_precos'] = analisar_melhores_e_piores_negociacoes_precos(
+        ordenar_precos(df_filtrado), dias_precos, n_precos, hoje)
+    return relatorios
@@ -0,0 +1,282 @@
+"""
+Mede tempo e pico de memória das computações do painel sobre dados sintéticos.
+
+Exemplo:
+    python benchmark_compras.py --tamanhos 100000 1000000 --repeticoes 3
+
+Os CSVs sintéticos (gerados por dados_sinteticos.py com semente e datas fixas) ficam
+em --dados e são reaproveitados entre execuções. Cada execução grava um JSON em
+--resultados e é comparada com a anterior; etapas cuja mediana de tempo piorou
+além de --tolerancia aparecem como regressão.
+
+A memória é medida de duas formas: o pico do tracemalloc (objetos Python e arrays
+numpy) e, numa execução sem tracemalloc, os picos de RSS do processo e de bytes
+alocados pelo pyarrow (leitura e escrita de Parquet), que o tracemalloc não vê.
+"""
+import argparse
+import gc
+import glob
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+import analise_compras
+from analise_compras import (
+    CuboCompra, DadosCompra, JANELAS_DIAS, aplicar_filtros, analisar_melhores_e_piores_negociacoes_precos,
+    calcular_cadencia_compras, calcular_metricas, compactar_tipos, comparar_periodos, construir_indice_filtros,
+    meses_abreviados_num_para_abv, ordenar_precos, periodos_comparacao,
+)
+from dados_sinteticos import escrever_csv_sintetico
+
+TAMANHOS_PADRAO = (100_000, 1_000_000, 10_000_000)
+# Fim fixo para os dados sintéticos: execuções diferentes medem exatamente os mesmos dados.
+FIM_DADOS = datetime(2025, 6, 30)
+# Diferenças absolutas menores que isso são ruído de medição, não regressão.
+PIORA_MINIMA_S = 0.005
+INTERVALO_AMOSTRAGEM_S = 0.002
+
+
+def _rss_atual():
+    """RSS do processo em bytes (psutil ou /proc), ou None se não houver como medir."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as arquivo:
+            return int(arquivo.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class AmostradorMemoria(threading.Thread):
+    """
+    Amostra o RSS do processo e `pyarrow.total_allocated_bytes()` a cada
+    `INTERVALO_AMOSTRAGEM_S` enquanto ativo e guarda quanto cada um subiu acima do
+    valor do início. Picos mais curtos que o intervalo podem escapar.
+    """
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self._parar = threading.Event()
+        self._rss_inicial = _rss_atual()
+        self._arrow_inicial = pa.total_allocated_bytes()
+        self.pico_rss = 0 if self._rss_inicial is not None else None
+        self.pico_arrow = 0
+
+    def _amostrar(self):
+        if self._rss_inicial is not None:
+            self.pico_rss = max(self.pico_rss, _rss_atual() - self._rss_inicial)
+        self.pico_arrow = max(self.pico_arrow, pa.total_allocated_bytes() - self._arrow_inicial)
+
+    def run(self):
+        while not self._parar.wait(INTERVALO_AMOSTRAGEM_S):
+            self._amostrar()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *_):
+        self._parar.set()
+        self.join()
+        self._amostrar()
+
+
+def _medir(funcao, repeticoes):
+    """
+    Executa `funcao` `repeticoes` vezes cronometrando, uma vez a mais amostrando RSS e
+    memória do pyarrow e outra sob tracemalloc.
+    """
+    tempos = []
+    for _ in range(repeticoes):
+        gc.collect()
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+
+    # A memória é medida em execuções separadas: o tracemalloc deixa a execução mais
+    # lenta e os próprios registros dele inflariam o RSS.
+    gc.collect()
+    with AmostradorMemoria() as amostrador:
+        funcao()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        funcao()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'tempo_min_s': round(min(tempos), 6),
+        'tempo_mediana_s': round(statistics.median(tempos), 6),
+        'pico_memoria_mb': round(pico / 2 ** 20, 3),
+        'pico_rss_mb': round(amostrador.pico_rss / 2 ** 20, 3) if amostrador.pico_rss is not None else None,
+        'pico_arrow_mb': round(amostrador.pico_arrow / 2 ** 20, 3),
+    }
+
+
+def _csv_sintetico(diretorio, n_linhas):
+    caminho = os.path.join(diretorio, f'sintetico_{n_linhas}.csv')
+    if not os.path.exists(caminho):
+        print(f"Gerando {n_linhas} linhas sintéticas em '{caminho}'...")
+        os.makedirs(diretorio, exist_ok=True)
+        escrever_csv_sintetico(caminho + '.tmp', n_linhas, fim=FIM_DADOS)
+        os.replace(caminho + '.tmp', caminho)
+    return caminho
+
+
+def _com_cache_vazio(funcao, caminho_csv):
+    diretorio_cache = tempfile.mkdtemp(prefix='benchmark_cache_')
+    try:
+        return funcao(caminho_csv, diretorio_cache)
+    finally:
+        shutil.rmtree(diretorio_cache, ignore_errors=True)
+
+
+def medir_tamanho(caminho_csv, repeticoes):
+    """Roda todas as etapas para um CSV e devolve {etapa: medidas}."""
+    # 'ingestao_*' é o `DadosCompra.atualizar` inteiro; 'snapshot_*' só a leitura do
+    # DataFrame (do CSV, gravando o snapshot, ou do Parquet) e as etapas seguintes
+    # montam as estruturas derivadas a partir dele.
+    resultados = {
+        'ingestao_csv': _medir(lambda: _com_cache_vazio(lambda c, d: DadosCompra(c, d).atualizar(), caminho_csv),
+                               repeticoes),
+        'snapshot_csv': _medir(lambda: _com_cache_vazio(analise_compras._carregar_snapshot, caminho_csv), repeticoes),
+    }
+
+    diretorio_cache = tempfile.mkdtemp(prefix='benchmark_cache_')
+    try:
+        DadosCompra(caminho_csv, diretorio_cache).atualizar()
+        resultados['ingestao_snapshot'] = _medir(lambda: DadosCompra(caminho_csv, diretorio_cache).atualizar(), repeticoes)
+        resultados['snapshot_parquet'] = _medir(
+            lambda: analise_compras._carregar_snapshot(caminho_csv, diretorio_cache), repeticoes)
+        df_bruto, _ = analise_compras._carregar_snapshot(caminho_csv, diretorio_cache)
+        dados = DadosCompra(caminho_csv, diretorio_cache)
+        dados.atualizar()
+    finally:
+        shutil.rmtree(diretorio_cache, ignore_errors=True)
+
+    df, indice = dados.df, dados.indice
+    # `compactar_tipos` altera o DataFrame recebido: a cópia entra na medida.
+    resultados['compactar_tipos'] = _medir(
+        lambda: compactar_tipos(analise_compras._adicionar_colunas_derivadas(df_bruto.copy())), repeticoes)
+    resultados['construir_cubo'] = _medir(lambda: CuboCompra().atualizar(df), repeticoes)
+    resultados['construir_indice_filtros'] = _medir(lambda: construir_indice_filtros(df), repeticoes)
+
+    ano = int(df['ano'].max())
+    mes = int(df.loc[df['ano'] == ano, 'mes'].max())
+    usuario = df['usuario'].value_counts().index[0]
+    hoje = df['data emissao'].max().to_pydatetime() + timedelta(days=1)
+    filtros = dict(ano=ano, mes=meses_abreviados_num_para_abv[mes], usuario=usuario)
+    df_ano = aplicar_filtros(df, ano=ano, indice=indice)
+
+    etapas = {
+        'aplicar_filtros_copia': lambda: aplicar_filtros(df, **filtros),
+        'aplicar_filtros_indice': lambda: aplicar_filtros(df, indice=indice, **filtros),
+        'calcular_metricas': lambda: calcular_metricas(df_ano),
+        'cubo_metricas': lambda: dados.cubo.metricas(ano=ano),
+        'comparar_periodos': lambda: comparar_periodos(df, periodos_comparacao(ano, mes, 'Mês anterior')),
+        'cadencia_compras': lambda: calcular_cadencia_compras(df, janelas=JANELAS_DIAS, hoje=hoje),
+        'ordenar_precos': lambda: ordenar_precos(df),
+    }
+    for nome, funcao in etapas.items():
+        resultados[nome] = _medir(funcao, repeticoes)
+
+    ordenados = dados.precos_ordenados
+    resultados['melhores_piores_precos'] = _medir(
+        lambda: analisar_melhores_e_piores_negociacoes_precos(ordenados, 90, 10, hoje), repeticoes)
+    return resultados
+
+
+def _commit_atual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(analise_compras.__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar_com_anterior(atual, anterior, tolerancia):
+    """Lista (tamanho, etapa, razão) das etapas cuja mediana de tempo piorou além da tolerância."""
+    regressoes = []
+    for tamanho, etapas in atual['resultados'].items():
+        for etapa, medidas in etapas.items():
+            referencia = anterior['resultados'].get(tamanho, {}).get(etapa)
+            if not referencia or not referencia['tempo_mediana_s']:
+                continue
+            razao = medidas['tempo_mediana_s'] / referencia['tempo_mediana_s']
+            piora = medidas['tempo_mediana_s'] - referencia['tempo_mediana_s']
+            marcador = '  <-- REGRESSÃO' if razao > 1 + tolerancia and piora > PIORA_MINIMA_S else ''
+            print(f"{tamanho:>10} {etapa:<26} {referencia['tempo_mediana_s']:>10.4f}s -> "
+                  f"{medidas['tempo_mediana_s']:>10.4f}s ({razao:5.2f}x){marcador}")
+            if marcador:
+                regressoes.append((tamanho, etapa, razao))
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tamanhos', nargs='+', type=int, default=list(TAMANHOS_PADRAO))
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--dados', default='.cache_benchmark', help='Diretório dos CSVs sintéticos.')
+    parser.add_argument('--resultados', default='benchmarks', help='Diretório dos JSONs de resultado.')
+    parser.add_argument('--tolerancia', type=float, default=0.2,
+                        help='Piora relativa da mediana de tempo considerada regressão (0.2 = 20%%).')
+    parser.add_argument('--falhar-em-regressao', action='store_true',
+                        help='Sai com código 1 se houver regressão em relação à execução anterior.')
+    args = parser.parse_args()
+
+    execucao = {
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'commit': _commit_atual(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'repeticoes': args.repeticoes,
+        'resultados': {},
+    }
+    for n_linhas in args.tamanhos:
+        caminho_csv = _csv_sintetico(args.dados, n_linhas)
+        print(f"Medindo {n_linhas} linhas...")
+        execucao['resultados'][str(n_linhas)] = medir_tamanho(caminho_csv, args.repeticoes)
+        for etapa, medidas in execucao['resultados'][str(n_linhas)].items():
+            rss = medidas['pico_rss_mb']
+            print(f"{n_linhas:>10} {etapa:<26} {medidas['tempo_mediana_s']:>10.4f}s "
+                  f"{medidas['pico_memoria_mb']:>10.1f} MB (RSS {'-' if rss is None else f'{rss:.1f}'} MB, "
+                  f"Arrow {medidas['pico_arrow_mb']:.1f} MB)")
+
+    os.makedirs(args.resultados, exist_ok=True)
+    anteriores = sorted(glob.glob(os.path.join(args.resultados, 'resultado_*.json')))
+    caminho = os.path.join(args.resultados, f"resultado_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(caminho, 'w', encoding='utf-8') as arquivo:
+        json.dump(execucao, arquivo, indent=2, ensure_ascii=False)
+    print(f"Resultados gravados em '{caminho}'.")
+
+    if anteriores:
+        with open(anteriores[-1], encoding='utf-8') as arquivo:
+            anterior = json.load(arquivo)
+        print(f"Comparação com '{anteriores[-1]}' (commit {anterior.get('commit')}):")
+        regressoes = comparar_com_anterior(execucao, anterior, args.tolerancia)
+        if regressoes and args.falhar_em_regressao:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
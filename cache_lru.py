@@ -0,0 +1,119 @@
+"""
+Cache LRU limitado por quantidade de itens e por memória, compartilhado entre sessões.
+
+Cada entrada guarda o valor e o tamanho estimado em bytes; ao passar de qualquer um
+dos limites as entradas usadas há mais tempo saem primeiro. Acertos, falhas e
+remoções são contados para o painel de desempenho.
+"""
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+
+def estimar_tamanho(valor):
+    """Tamanho aproximado em bytes de DataFrames, bytes/str e coleções deles."""
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(deep=True).sum())
+    if isinstance(valor, pd.Series):
+        return int(valor.memory_usage(deep=True))
+    if isinstance(valor, (bytes, bytearray, str)):
+        return len(valor)
+    if isinstance(valor, (list, tuple)):
+        return sum(estimar_tamanho(item) for item in valor)
+    if isinstance(valor, dict):
+        return sum(estimar_tamanho(item) for item in valor.values())
+    return 0
+
+
+class CacheLRU:
+    """
+    Mapeamento chave -> valor com despejo LRU.
+
+    Args:
+        limite_itens (int): Quantidade máxima de entradas.
+        limite_bytes (int): Soma máxima dos tamanhos estimados. Um valor maior que o
+                            limite sozinho não é guardado.
+        medir_tamanho (callable): Estima o tamanho de um valor; padrão `estimar_tamanho`.
+        ao_remover (callable): `ao_remover(chave, valor)` para cada entrada que sai do
+                               cache (despejo, substituição ou `limpar`), fora do lock;
+                               por exemplo, para apagar um arquivo guardado pelo caminho.
+    """
+
+    def __init__(self, limite_itens=256, limite_bytes=64 * 2 ** 20, medir_tamanho=estimar_tamanho, ao_remover=None):
+        self.limite_itens = limite_itens
+        self.limite_bytes = limite_bytes
+        self.medir_tamanho = medir_tamanho
+        self.ao_remover = ao_remover
+        self.acertos = 0
+        self.falhas = 0
+        self.remocoes = 0
+        self.bytes = 0
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def obter(self, chave, padrao=None):
+        with self._lock:
+            if chave in self._entradas:
+                self._entradas.move_to_end(chave)
+                self.acertos += 1
+                return self._entradas[chave][0]
+            self.falhas += 1
+            return padrao
+
+    def guardar(self, chave, valor, tamanho=None):
+        tamanho = self.medir_tamanho(valor) if tamanho is None else tamanho
+        removidas = []
+        with self._lock:
+            if chave in self._entradas:
+                anterior, tamanho_anterior = self._entradas.pop(chave)
+                self.bytes -= tamanho_anterior
+                if anterior is not valor:
+                    removidas.append((chave, anterior))
+            if tamanho <= self.limite_bytes:
+                self._entradas[chave] = (valor, tamanho)
+                self.bytes += tamanho
+                while len(self._entradas) > self.limite_itens or self.bytes > self.limite_bytes:
+                    chave_removida, (valor_removido, tamanho_removido) = self._entradas.popitem(last=False)
+                    self.bytes -= tamanho_removido
+                    self.remocoes += 1
+                    removidas.append((chave_removida, valor_removido))
+        self._avisar_remocoes(removidas)
+        return valor
+
+    def _avisar_remocoes(self, removidas):
+        if self.ao_remover is not None:
+            for chave, valor in removidas:
+                self.ao_remover(chave, valor)
+
+    def obter_ou_calcular(self, chave, calcular):
+        """Devolve o valor em cache ou calcula com `calcular()`, guarda e devolve."""
+        ausente = object()
+        valor = self.obter(chave, ausente)
+        if valor is ausente:
+            # Calcula fora do lock: duas sessões com a mesma chave podem calcular em
+            # paralelo, mas nenhuma bloqueia as consultas de outras chaves.
+            valor = self.guardar(chave, calcular())
+        return valor
+
+    def limpar(self):
+        with self._lock:
+            removidas = [(chave, valor) for chave, (valor, _) in self._entradas.items()]
+            self._entradas.clear()
+            self.bytes = 0
+        self._avisar_remocoes(removidas)
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self.acertos + self.falhas
+            return {
+                'itens': len(self._entradas),
+                'MB': round(self.bytes / 2 ** 20, 3),
+                'acertos': self.acertos,
+                'falhas': self.falhas,
+                'taxa de acerto (%)': round(100 * self.acertos / consultas, 1) if consultas else 0.0,
+                'remoções': self.remocoes,
+            }
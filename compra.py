@@ -4,7 +4,21 @@ import streamlit as st
 from datetime import datetime
 import plotly.express as px
 import locale
-from datetime import datetime, timedelta
+import os
+import shutil
+import uuid
+
+from analise_compras import (
+    CAMINHO_CSV, DIRETORIO_CACHE, DadosCompra, JANELAS_DIAS, MODOS_COMPARACAO, ORDENACOES_PENDENTES,
+    analisar_melhores_e_piores_negociacoes_precos, aplicar_filtros, calcular_cadencia_compras, comparar_periodos,
+    formatar_moeda, formatar_moeda_serie, meses_abreviados_num_para_abv, periodos_comparacao,
+)
+from cache_lru import CacheLRU
+from consultas_duckdb import BackendDuckDB
+from exportacao import (
+    FORMATOS_EXPORTACAO, exportar_em_cache, formatos_disponiveis, gerar_exportacao, remover_arquivo_exportado,
+)
+from instrumentacao import configurar_log_desempenho, historico_desempenho, iniciar_medicao
 
 try:
     locale.setlocale(locale.LC_TIME, 'pt_BR.UTF-8')
@@ -16,172 +30,183 @@ except locale.Error:
 
 st.set_page_config(page_title="Go MED SAÚDE", page_icon=":bar_chart:", layout="wide")
 
-df = pd.read_csv('df_compra.csv')
+# Formatação de moeda na camada de renderização do Plotly: separador decimal ','
+# e de milhar '.', com o valor numérico preservado no gráfico.
+SEPARADORES_PLOTLY = ',.'
+TEXTO_MOEDA_PLOTLY = 'R$ %{y:,.2f}'
+DIRETORIO_EXPORTACOES = os.path.join(DIRETORIO_CACHE, 'exportacoes')
 
-df['data entrega prevista'] = pd.to_datetime(df['data entrega prevista'], errors='coerce')
-df['data entrada'] = pd.to_datetime(df['data entrada'], errors='coerce')
-df['data emissao'] = pd.to_datetime(df['data emissao'], format='%d/%m/%Y', errors='coerce')
 
-def calcular_prazo_medio_e_frequencia(df):
-    
-    hoje = datetime.now()
-    tres_meses_atras = hoje - timedelta(days=90) # Aproximadamente 3 meses
-
-    # Filtrar as compras dos últimos 3 meses
-    df_recentes = df[df['data emissao'] >= tres_meses_atras].copy()
-
-    if df_recentes.empty:
-        return pd.DataFrame(columns=['Produto', 'Prazo Médio de Compra (dias)', 'Frequência de Compra'])
-
-    # Ordenar por produto e data de emissão
-    df_recentes = df_recentes.sort_values(by=['descricao produto', 'data emissao'])
-
-    # Calcular a diferença entre as datas de emissão para cada produto
-    df_recentes['data_anterior'] = df_recentes.groupby('descricao produto')['data emissao'].shift(1)
-    df_recentes['diferenca_dias'] = (df_recentes['data emissao'] - df_recentes['data_anterior']).dt.days
-
-    # Calcular o prazo médio de compra
-    prazo_medio = df_recentes.groupby('descricao produto')['diferenca_dias'].mean().fillna(0).round(2)
-
-    # Calcular a frequência de compra (contagem de pedidos por produto)
-    frequencia = df_recentes['descricao produto'].value_counts().sort_index()
-
-    # Criar o DataFrame de resultado
-    df_resultado = pd.DataFrame({
-        'Prazo Médio de Compra (dias)': prazo_medio,
-        'Frequência de Compra': frequencia
-    })
-
-    df_resultado = df_resultado.reset_index().rename(columns={'descricao produto': 'Produto'})
-
-    return df_resultado
-
-def analisar_melhores_e_piores_negociacoes_precos_ultimos_90_dias(df):
+def formatar_colunas_moeda(df, colunas, manter_numerico=True):
     """
-    Analisa os 10 melhores (menores preços de compra) e os 10 piores (maiores preços de compra)
-    negociações nos últimos 90 dias.
+    Prepara colunas de valor em reais para exibição em `st.dataframe`.
 
-    Args:
-        df (pd.DataFrame): DataFrame contendo as colunas 'descricao produto', 'data emissao' e 'preco unitario liquido item'.
-                           A coluna 'data emissao' deve estar no formato datetime.
+    Com `manter_numerico=True` o DataFrame não é alterado (a ordenação no grid continua
+    numérica) e a formatação fica para o `column_config` do Streamlit. Caso contrário
+    as colunas são convertidas em texto pt-BR ("R$ 1.234,56", independente do idioma
+    do navegador) de uma vez com `formatar_moeda_serie`; serve para tabelas já
+    ordenadas no servidor, como a página de pedidos pendentes.
 
     Returns:
-        tuple: Uma tupla contendo dois DataFrames:
-               - df_melhores: DataFrame com os 10 menores preços de compra distintos nos últimos 90 dias.
-               - df_piores: DataFrame com os 10 maiores preços de compra distintos nos últimos 90 dias.
+        tuple: (DataFrame para exibir, dict de `column_config` para `st.dataframe`).
     """
-    hoje = datetime.now()
-    noventa_dias_atras = hoje - timedelta(days=90)
-
-    # Filtrar o DataFrame para incluir apenas os dados dos últimos 90 dias
-    df_recentes = df[df['data emissao'] >= noventa_dias_atras].copy()
-
-    if df_recentes.empty:
-        return pd.DataFrame(columns=['Produto', 'Preço Unitário']), pd.DataFrame(columns=['Produto', 'Preço Unitário'])
-
-    # Ordenar os dados recentes por produto, data de emissão (descendente) e preço (ascendente)
-    df_ordenado = df_recentes.sort_values(by=['descricao produto', 'data emissao', 'preco unitario liquido item'],
-                                        ascending=[True, False, True])
-
-    # Selecionar o menor preço recente por produto
-    df_menores_precos = df_ordenado.groupby('descricao produto').first().reset_index()
-
-    # Ordenar pelos menores preços e selecionar os 10 primeiros
-    top_10_menores = df_menores_precos.sort_values(by='preco unitario liquido item').head(10)
-    df_melhores = top_10_menores[['descricao produto', 'preco unitario liquido item']].rename(
-        columns={'descricao produto': 'Produto', 'preco unitario liquido item': 'Preço Unitário'})
-
-    # Ordenar os dados recentes por produto, data de emissão (descendente) e preço (descendente)
-    df_ordenado_maior = df_recentes.sort_values(by=['descricao produto', 'data emissao', 'preco unitario liquido item'],
-                                            ascending=[True, False, False])
-
-    # Selecionar o maior preço recente por produto
-    df_maiores_precos = df_ordenado_maior.groupby('descricao produto').first().reset_index()
-
-    # Ordenar pelos maiores preços e selecionar os 10 primeiros
-    top_10_maiores = df_maiores_precos.sort_values(by='preco unitario liquido item', ascending=False).head(10)
-    df_piores = top_10_maiores[['descricao produto', 'preco unitario liquido item']].rename(
-        columns={'descricao produto': 'Produto', 'preco unitario liquido item': 'Preço Unitário'})
-
-    return df_melhores, df_piores
-
+    if manter_numerico:
+        return df, {coluna: st.column_config.NumberColumn(coluna, format='localized') for coluna in colunas}
+    df = df.copy()
+    for coluna in colunas:
+        df[coluna] = formatar_moeda_serie(df[coluna])
+    return df, {}
+
+
+@st.cache_resource
+def _backend_consultas():
+    # COMPRA_BACKEND=duckdb agrega cards e gráficos no DuckDB sobre Parquet particionado;
+    # o padrão ('pandas') usa o cubo em memória.
+    if os.environ.get('COMPRA_BACKEND', 'pandas') != 'duckdb':
+        return None
+    try:
+        return BackendDuckDB(os.path.join(DIRETORIO_CACHE, 'particoes'))
+    except ImportError as erro:
+        # Sem o pacote o painel segue com o cubo em memória (o None fica em cache).
+        print(f"Backend DuckDB indisponível, usando pandas: {erro}")
+        return None
+
+
+@st.cache_resource
+def _dados_compra():
+    # Só a primeira sessão do processo espera a carga; depois o monitor recarrega em
+    # segundo plano e publica cada versão nova de uma vez.
+    # COMPRA_ORIGEM_DADOS pode apontar para o CSV ou para um diretório de exportações.
+    backend = _backend_consultas()
+    # Com o backend DuckDB o cubo em memória só é montado no fallback (versão não sincronizada).
+    dados = DadosCompra(os.environ.get('COMPRA_ORIGEM_DADOS', CAMINHO_CSV), com_cubo=backend is None)
+    if backend is not None:
+        # As partições de cada versão ficam prontas antes de ela ser publicada.
+        dados.ao_publicar(backend.sincronizar)
+    dados.atualizar()
+    dados.iniciar_monitor(float(os.environ.get('COMPRA_INTERVALO_MONITOR', 5)))
+    return dados
+
+
+def _tamanho_figura(figura):
+    # O Streamlit envia a figura como JSON: esse é o tamanho que interessa limitar.
+    return len(figura.to_json()) if figura is not None else 0
+
+
+@st.cache_resource
+def _cache_graficos():
+    return CacheLRU(limite_itens=int(os.environ.get('COMPRA_CACHE_GRAFICOS_ITENS', 256)),
+                    limite_bytes=int(os.environ.get('COMPRA_CACHE_GRAFICOS_MB', 64)) * 2 ** 20,
+                    medir_tamanho=_tamanho_figura)
+
+
+@st.cache_resource
+def _cache_exportacoes():
+    # Caminhos dos arquivos exportados em DIRETORIO_EXPORTACOES: o limite em MB é de espaço
+    # em disco. Arquivos maiores que ele são gerados de novo a cada download. O diretório
+    # é do processo e é limpo aqui (sobras de uma execução anterior).
+    shutil.rmtree(DIRETORIO_EXPORTACOES, ignore_errors=True)
+    return CacheLRU(limite_itens=int(os.environ.get('COMPRA_CACHE_EXPORTACOES_ITENS', 32)),
+                    limite_bytes=int(os.environ.get('COMPRA_CACHE_EXPORTACOES_MB', 256)) * 2 ** 20,
+                    ao_remover=remover_arquivo_exportado)
+
+
+@st.cache_resource
+def _log_desempenho():
+    # Uma linha JSON por rerun; `python instrumentacao.py <log>` resume p50/p95.
+    return configurar_log_desempenho(os.environ.get('COMPRA_LOG_DESEMPENHO', os.path.join(DIRETORIO_CACHE, 'desempenho.jsonl')))
+
+
+def exibir_painel_desempenho(registro, caches):
+    """Mostra na barra lateral os tempos e a memória do rerun, os caches e os percentis do processo."""
+    st.sidebar.subheader("Desempenho")
+    st.sidebar.metric("Tempo do Rerun", f"{registro['total_ms']:.0f} ms")
+    st.sidebar.dataframe(pd.DataFrame(list(registro['secoes'].items()), columns=['Seção', 'Tempo (ms)']),
+                         hide_index=True)
+    funcoes = pd.DataFrame([(nome, dados['chamadas'], dados['ms']) for nome, dados in registro['funcoes'].items()],
+                           columns=['Função', 'Chamadas', 'Tempo (ms)'])
+    st.sidebar.dataframe(funcoes.sort_values('Tempo (ms)', ascending=False), hide_index=True)
+    st.sidebar.dataframe(pd.DataFrame(list(registro['memoria_mb'].items()), columns=['Memória', 'MB']), hide_index=True)
+    st.sidebar.dataframe(pd.DataFrame.from_dict({nome: cache.estatisticas() for nome, cache in caches.items()}, orient='index'))
+    st.sidebar.caption("Percentis dos últimos reruns de todas as sessões:")
+    st.sidebar.dataframe(historico_desempenho.percentis(), hide_index=True)
+
+
+def botoes_exportacao(nome, parametros, obter_tabela):
+    """
+    Botões de download de uma tabela em cada formato disponível.
 
+    A tabela e o arquivo só são gerados no clique, numa thread à parte do rerun; o
+    arquivo é gravado em disco uma fatia por vez. A chave do cache é (versão dos
+    dados, tabela, parâmetros, formato), então exportar de novo a mesma seleção não
+    gera o arquivo outra vez. O Streamlit lê o arquivo devolvido inteiro e guarda o
+    payload em memória para servir o download: cada download ativo ocupa o tamanho
+    do arquivo em memória.
 
-def formatar_moeda(valor, simbolo_moeda='R$'):
-    try:
-        valor = float(valor)
-        return f"{simbolo_moeda} {valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-    except (ValueError, TypeError):
-        return f"{simbolo_moeda} 0,00"
-
-def aplicar_filtros(df, ano='todos', mes='todos', usuario='todos', situacao='todos', tipo_fornecedor='todos'):
-    df_filtrado = df.copy()
-    ano_atual = datetime.now().year
-    meses_abreviados_num_para_abv = {
-        1: 'Jan', 2: 'Fev', 3: 'Mar', 4: 'Abr', 5: 'Mai', 6: 'Jun',
-        7: 'Jul', 8: 'Ago', 9: 'Set', 10: 'Out', 11: 'Nov', 12: 'Dez'
-    }
-    meses_abreviados_abv_para_num = {v: k for k, v in meses_abreviados_num_para_abv.items()}
-
-    if ano == 'todos':
-        df_filtrado = df_filtrado[df_filtrado['ano'] == ano_atual]
-    elif ano != 'todos':
-        df_filtrado = df_filtrado[df_filtrado['ano'] == int(ano)]
-
-    if mes == 'todos':
-        df_filtrado['mes_nome'] = df_filtrado['mes'].map(meses_abreviados_num_para_abv)
-    elif mes != 'todos':
-        if mes in meses_abreviados_abv_para_num:
-            df_filtrado = df_filtrado[df_filtrado['mes'] == meses_abreviados_abv_para_num[mes]]
-            df_filtrado['mes_nome'] = mes
-        elif isinstance(mes, int):
-            df_filtrado = df_filtrado[df_filtrado['mes'] == mes]
-            df_filtrado['mes_nome'] = meses_abreviados_num_para_abv.get(mes)
-        else:
-            df_filtrado['mes_nome'] = None  
+    Args:
+        nome (str): Nome da tabela; vira o nome do arquivo e a chave dos widgets.
+        parametros (tuple): Tudo, além da versão dos dados, de que a tabela depende.
+        obter_tabela (callable): Sem argumentos; devolve o DataFrame a exportar.
+    """
+    formatos = formatos_disponiveis()
+    for coluna, formato in zip(st.columns(len(formatos)), formatos):
+        extensao, mime = FORMATOS_EXPORTACAO[formato]
+        chave = (versao_dados.numero, nome, parametros, formato)
 
-    if usuario != 'todos':
-        df_filtrado = df_filtrado[df_filtrado['usuario'] == usuario]
+        def gerar_arquivo(chave=chave, formato=formato):
+            return exportar_em_cache(cache_exportacoes, chave, lambda: gerar_exportacao(obter_tabela(), formato),
+                                     DIRETORIO_EXPORTACOES)
 
-    if situacao != 'todos':
-        df_filtrado = df_filtrado[df_filtrado['situacao pedido'] == situacao]
+        with coluna:
+            st.download_button(f"Exportar {formato}", data=gerar_arquivo, file_name=f"{nome}.{extensao}", mime=mime,
+                               key=f'exportar_{nome}_{formato}', on_click='ignore')
 
-    if tipo_fornecedor != 'todos':
-        df_filtrado = df_filtrado[df_filtrado['tipo fornecedor'] == tipo_fornecedor]
 
-    return df_filtrado
+_log_desempenho()
+cache_graficos = _cache_graficos()
+cache_exportacoes = _cache_exportacoes()
+if 'id_sessao' not in st.session_state:
+    st.session_state['id_sessao'] = uuid.uuid4().hex
+medicao = iniciar_medicao(st.session_state['id_sessao'])
 
 ano_atual = datetime.now().year
-meses_abreviados_num_para_abv = {
-    1: 'Jan', 2: 'Fev', 3: 'Mar', 4: 'Abr', 5: 'Mai', 6: 'Jun',
-    7: 'Jul', 8: 'Ago', 9: 'Set', 10: 'Out', 11: 'Nov', 12: 'Dez'
-}
-meses_ano_atual_numericos = sorted(list(df[df['ano'] == ano_atual]['mes'].unique()))
-meses_ano_atual_nomes = ['todos'] + [meses_abreviados_num_para_abv[mes] for mes in meses_ano_atual_numericos]
-
-col1, col2, col3, col4, col5 = st.columns(5)
-with col1:
-    anos_unicos = ['todos'] + sorted(list(df['ano'].unique()))
-    index_ano_atual = anos_unicos.index(ano_atual) if ano_atual in anos_unicos else 0
-    ano = st.selectbox("Ano", anos_unicos, index=index_ano_atual)
-with col2:
-    mes = st.selectbox("Mês", meses_ano_atual_nomes)
-with col3:
-    usuario = st.selectbox("Usuário", ['todos'] + sorted(list(df['usuario'].unique())))
-with col4:
-    situacao = st.selectbox("Situação", ['todos'] + sorted(list(df['situacao pedido'].unique())))
-with col5:
-    tipo_fornecedor = st.selectbox("Tipo de Fornecedor", ['todos'] + sorted(list(df['tipo fornecedor'].unique())))
-
-df_filtrado = aplicar_filtros(df, ano, mes, usuario, situacao, tipo_fornecedor)
-
-def calcular_metricas(df):
-    qunatidade_total_pedidos = df['numeropedido'].nunique()
-    valor_total_pedidos = df['valor liquido item'].sum()
-    quantidade_total_itens = df['qtd pedido item'].sum()
-    quantidade_pedidos_entregues = df[df['situacao pedido'] == 'fechado pedido chegou']['numeropedido'].nunique()
-    quantidade_pedidos_pendentes = df[df['situacao pedido'] == 'pendente']['numeropedido'].nunique()
-    return qunatidade_total_pedidos, valor_total_pedidos, quantidade_total_itens, quantidade_pedidos_entregues, quantidade_pedidos_pendentes
+with medicao.secao('Carga de dados'):
+    dados_compra = _dados_compra()
+    # Uma única leitura de `atual`: o rerun inteiro usa a mesma versão dos dados.
+    versao_dados = dados_compra.atual
+    df = versao_dados.df
+    medicao.registrar_dataframe('compartilhado', df)
+
+st.caption(f"Dados carregados em {versao_dados.carregado_em:%d/%m/%Y %H:%M:%S} "
+           f"(arquivo modificado em {versao_dados.arquivo_modificado_em:%d/%m/%Y %H:%M:%S}, versão {versao_dados.numero})")
+if dados_compra.ultimo_erro is not None:
+    st.warning(f"⚠️ A última atualização automática dos dados falhou: {dados_compra.ultimo_erro}. "
+               "Exibindo a versão anterior.")
+
+with medicao.secao('Filtros'):
+    meses_ano_atual_numericos = sorted(list(df[df['ano'] == ano_atual]['mes'].unique()))
+    meses_ano_atual_nomes = ['todos'] + [meses_abreviados_num_para_abv[mes] for mes in meses_ano_atual_numericos]
+
+    col1, col2, col3, col4, col5 = st.columns(5)
+    with col1:
+        anos_unicos = ['todos'] + sorted(list(df['ano'].unique()))
+        index_ano_atual = anos_unicos.index(ano_atual) if ano_atual in anos_unicos else 0
+        ano = st.selectbox("Ano", anos_unicos, index=index_ano_atual)
+    with col2:
+        mes = st.selectbox("Mês", meses_ano_atual_nomes)
+    with col3:
+        usuario = st.selectbox("Usuário", ['todos'] + sorted(list(df['usuario'].unique())))
+    with col4:
+        situacao = st.selectbox("Situação", ['todos'] + sorted(list(df['situacao pedido'].unique())))
+    with col5:
+        tipo_fornecedor = st.selectbox("Tipo de Fornecedor", ['todos'] + sorted(list(df['tipo fornecedor'].unique())))
+
+# Cards e gráficos saem do cubo pré-agregado (ou da consulta DuckDB da mesma versão,
+# que tem a mesma interface), sem reagregar as linhas de item no pandas.
+filtros_painel = dict(ano=ano, mes=mes, usuario=usuario, situacao=situacao, tipo_fornecedor=tipo_fornecedor)
+backend_consultas = _backend_consultas()
+consulta_duckdb = backend_consultas.consulta(versao_dados.numero) if backend_consultas is not None else None
+cubo = consulta_duckdb or versao_dados.cubo
 
 def card_style(metric_name, value, color="#FFFFFF", bg_color="#262730"):
     return f"""
@@ -198,130 +223,173 @@ def card_style(metric_name, value, color="#FFFFFF", bg_color="#262730"):
     </div>
     """
 
-qtd_total_pedidos, valor_total, qtd_total_itens, qtd_entregues, qtd_pendentes = calcular_metricas(df_filtrado)
+with medicao.secao('Cards'):
+    qtd_total_pedidos, valor_total, qtd_total_itens, qtd_entregues, qtd_pendentes = cubo.metricas(**filtros_painel)
 
-col1_metricas, col2_metricas, col3_metricas, col4_metricas, col5_metricas = st.columns([1, 1, 1, 1, 1])
+    col1_metricas, col2_metricas, col3_metricas, col4_metricas, col5_metricas = st.columns([1, 1, 1, 1, 1])
 
-with col1_metricas:
-    st.markdown(card_style("QTD Pedidos", qtd_total_pedidos), unsafe_allow_html=True)
+    with col1_metricas:
+        st.markdown(card_style("QTD Pedidos", qtd_total_pedidos), unsafe_allow_html=True)
 
-with col2_metricas:
-    st.markdown(card_style("Valor Total", formatar_moeda(valor_total)), unsafe_allow_html=True)
+    with col2_metricas:
+        st.markdown(card_style("Valor Total", formatar_moeda(valor_total)), unsafe_allow_html=True)
 
-with col3_metricas:
-    st.markdown(card_style("QTD Itens", qtd_total_itens), unsafe_allow_html=True)
+    with col3_metricas:
+        st.markdown(card_style("QTD Itens", qtd_total_itens), unsafe_allow_html=True)
 
-with col4_metricas:
-    st.markdown(card_style("Pedidos Recebidos", qtd_entregues), unsafe_allow_html=True)
+    with col4_metricas:
+        st.markdown(card_style("Pedidos Recebidos", qtd_entregues), unsafe_allow_html=True)
 
-with col5_metricas:
-    st.markdown(card_style("Pedidos Pendentes", qtd_pendentes), unsafe_allow_html=True)
+    with col5_metricas:
+        st.markdown(card_style("Pedidos Pendentes", qtd_pendentes), unsafe_allow_html=True)
 
 st.markdown("---")
 
 # --- GRÁFICOS ---
 
-# Gráfico de Distribuição de Status dos Pedidos
-status_counts = df_filtrado['status pedido'].value_counts().reset_index()
-status_counts.columns = ['status pedido', 'quantidade']
-fig_status = px.pie(status_counts, names='status pedido', values='quantidade',
-                    title='<b>Distribuição de Status dos Pedidos</b>')
-st.plotly_chart(fig_status, use_container_width=True)
-
-# Gráfico de Valor Total dos Pedidos por Mês 
-if not df_filtrado.empty:
-    valor_por_mes = df_filtrado.groupby(['ano', 'mes_nome'])['valor liquido item'].sum().reset_index()
-    valor_por_mes.rename(columns={'mes_nome': 'mes'}, inplace=True) 
+def construir_grafico_status(cubo, filtros):
+    status_counts = cubo.contagem_status(**filtros)
+    return px.pie(status_counts, names='status pedido', values='quantidade',
+                  title='<b>Distribuição de Status dos Pedidos</b>')
+
+
+def construir_grafico_valor_por_mes(cubo, filtros):
+    valor_por_mes = cubo.valor_por_mes(**filtros)
+    if valor_por_mes.empty:
+        return None
+    valor_por_mes.rename(columns={'mes_nome': 'mes'}, inplace=True)
     meses_ordenados = ['Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun', 'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez']
     valor_por_mes['mes_ordenado'] = pd.Categorical(valor_por_mes['mes'], categories=meses_ordenados, ordered=True)
     valor_por_mes = valor_por_mes.sort_values('mes_ordenado')
-    valor_por_mes['valor_formatado'] = valor_por_mes['valor liquido item'].apply(formatar_moeda)
     fig_valor_mes = px.bar(valor_por_mes, x='mes', y='valor liquido item',
-                            labels={'valor liquido item': 'Valor Total', 'mes': 'Mês'},
-                            title='<b>Valor Total dos Pedidos por Mês (Filtrado)</b>',
-                            text='valor_formatado',
-                            hover_data={'valor liquido item': ':.2f', 'mes': True},
-                            height=900, width=1100)
-    fig_valor_mes.update_traces(textposition='outside', textfont_size=28)
-    st.plotly_chart(fig_valor_mes, use_container_width=True)
-else:
-    st.info("Não há dados para exibir o gráfico de valor por mês com os filtros aplicados.")
+                           labels={'valor liquido item': 'Valor Total', 'mes': 'Mês'},
+                           title='<b>Valor Total dos Pedidos por Mês (Filtrado)</b>',
+                           hover_data={'valor liquido item': ':,.2f', 'mes': True},
+                           height=900, width=1100)
+    fig_valor_mes.update_traces(texttemplate=TEXTO_MOEDA_PLOTLY, textposition='outside', textfont_size=28)
+    fig_valor_mes.update_layout(separators=SEPARADORES_PLOTLY)
+    return fig_valor_mes
+
+
+def construir_grafico_top_fornecedores(cubo, filtros):
+    top_10_fornecedores_graf = cubo.top_fornecedores(**filtros)
+    fig_top_fornecedores = px.bar(top_10_fornecedores_graf, x='fornecedor', y='valor liquido item',
+                                  labels={'valor liquido item': 'Valor Total', 'fornecedor': 'Fornecedor'},
+                                  title='<b>Top 10 Fornecedores por Valor Total</b>',
+                                  hover_data={'valor liquido item': ':,.2f', 'fornecedor': True},
+                                  height=900, width=1100)
+    fig_top_fornecedores.update_traces(texttemplate=TEXTO_MOEDA_PLOTLY, textposition='outside', textfont_size=28)
+    fig_top_fornecedores.update_layout(separators=SEPARADORES_PLOTLY)
+    return fig_top_fornecedores
+
+
+def grafico_em_cache(construir):
+    """
+    Figura do cache de gráficos para (versão dos dados, gráfico, filtros); numa falha
+    agrega no cubo e monta a figura. Widgets que não entram na chave (o rádio de
+    variação de preço, a paginação dos pendentes) não refazem nenhum gráfico.
+    """
+    chave = (versao_dados.numero, construir.__name__) + tuple(filtros_painel.values())
+    return cache_graficos.obter_ou_calcular(chave, lambda: construir(cubo, filtros_painel))
 
-st.markdown("---")
 
-# Gráfico de Top 10 Fornecedores por Valor Total
-top_10_fornecedores_graf = df_filtrado.groupby('fornecedor')['valor liquido item'].sum().nlargest(10).reset_index()
-top_10_fornecedores_graf['valor_formatado'] = top_10_fornecedores_graf['valor liquido item'].apply(formatar_moeda)
-fig_top_fornecedores = px.bar(top_10_fornecedores_graf, x='fornecedor', y='valor liquido item',
-                                 labels={'valor liquido item': 'Valor Total', 'fornecedor': 'Fornecedor'},
-                                 title='<b>Top 10 Fornecedores por Valor Total</b>',
-                                 text='valor_formatado',
-                                 hover_data={'valor liquido item': ':.2f', 'fornecedor': True},
-                                 height=900, width=1100)
-fig_top_fornecedores.update_traces(textposition='outside', textfont_size=28)
-st.plotly_chart(fig_top_fornecedores, use_container_width=True)
+# Gráfico de Distribuição de Status dos Pedidos
+with medicao.secao('Gráfico de status'):
+    st.plotly_chart(grafico_em_cache(construir_grafico_status), use_container_width=True)
+
+# Gráfico de Valor Total dos Pedidos por Mês
+with medicao.secao('Gráfico de valor por mês'):
+    fig_valor_mes = grafico_em_cache(construir_grafico_valor_por_mes)
+    if fig_valor_mes is not None:
+        st.plotly_chart(fig_valor_mes, use_container_width=True)
+    else:
+        st.info("Não há dados para exibir o gráfico de valor por mês com os filtros aplicados.")
 
 st.markdown("---")
 
+# Gráfico de Top 10 Fornecedores por Valor Total
+with medicao.secao('Gráfico de fornecedores'):
+    st.plotly_chart(grafico_em_cache(construir_grafico_top_fornecedores), use_container_width=True)
 
-def listar_pedidos_pendentes_detalhado(df):
-    pedidos_pendentes = df[df['situacao pedido'] == 'pendente'].copy()
-    pedidos_unicos = pedidos_pendentes['numeropedido'].nunique()
-    if pedidos_unicos > 0:
-        st.warning(f"⚠️ Atenção! {pedidos_unicos} pedidos estão com entrega pendente:")
-    if not pedidos_pendentes.empty:
-        st.subheader("Pedidos Pendentes")
-        colunas_exibir_originais = ['numeropedido', 'status pedido', 'data emissao', 'data entrega prevista', 'data entrada', 'fornecedor', 'descricao produto', 'total itens', 'valor liquido item']
-        pedidos_pendentes_exibir = pedidos_pendentes[colunas_exibir_originais].copy()
-
-        # Converter as colunas de data para datetime
-        for col in ['data emissao', 'data entrega prevista']:
-            if col in pedidos_pendentes_exibir.columns:
-                pedidos_pendentes_exibir[col] = pd.to_datetime(pedidos_pendentes_exibir[col], format='%d/%m/%Y', errors='coerce')
-                nao_datetime = pedidos_pendentes_exibir[pd.isna(pedidos_pendentes_exibir[col])]
-                if not nao_datetime.empty:
-                    st.warning(f"⚠️ Atenção! Alguns valores na coluna '{col}' não puderam ser convertidos para data. Verifique os dados.")
-                    st.dataframe(nao_datetime[[col]])
-
-        # Calcular o prazo de entrega em dias
-        if 'data emissao' in pedidos_pendentes_exibir.columns and 'data entrega prevista' in pedidos_pendentes_exibir.columns:
-            pedidos_pendentes_exibir['prazo entrega (dias)'] = (pedidos_pendentes_exibir['data entrega prevista'] - pedidos_pendentes_exibir['data emissao']).dt.days
-            colunas_exibir = colunas_exibir_originais + ['prazo entrega (dias)']
-        else:
-            st.error("Erro: As colunas de data não foram convertidas corretamente. O cálculo do prazo de entrega não será realizado.")
-            colunas_exibir = colunas_exibir_originais
 
-        # 👉 Calcular o total antes de formatar os valores
-        total_valor_liquido = pedidos_pendentes_exibir['valor liquido item'].sum()
+def selecao_filtrada(versao, consulta, filtros):
+    # Linhas de item do recorte: lidas do Parquet pelo DuckDB ou pelo índice em memória.
+    if consulta is not None:
+        return consulta.aplicar_filtros(**filtros)
+    return aplicar_filtros(versao.df, **filtros, indice=versao.indice)
 
-        # Formatar colunas para exibição
-        pedidos_pendentes_exibir_formatado = pedidos_pendentes_exibir[colunas_exibir].copy()
-        for col in ['data emissao', 'data entrega prevista']:
-            if col in pedidos_pendentes_exibir_formatado.columns and pd.api.types.is_datetime64_any_dtype(pedidos_pendentes_exibir_formatado[col]):
-                pedidos_pendentes_exibir_formatado[col] = pedidos_pendentes_exibir_formatado[col].dt.strftime('%d/%m/%Y')
 
-        pedidos_pendentes_exibir_formatado['valor liquido item'] = pedidos_pendentes_exibir_formatado['valor liquido item'].apply(
-            lambda x: f'R$ {x:,.2f}'.replace(",", "X").replace(".", ",").replace("X", ".")
-        )
+with medicao.secao('Exportação da seleção'):
+    with st.expander("Exportar itens filtrados"):
+        # A consulta capturada mantém os arquivos Parquet da versão enquanto a exportação adiada existir.
+        botoes_exportacao('itens_filtrados', tuple(filtros_painel.values()),
+                          lambda versao=versao_dados, consulta=consulta_duckdb, filtros=filtros_painel:
+                          selecao_filtrada(versao, consulta, filtros))
 
-        st.dataframe(pedidos_pendentes_exibir_formatado)
+st.markdown("---")
 
-        # Exibir total formatado
-        st.info(f"Valor Total dos Pedidos Pendentes: {formatar_moeda(total_valor_liquido)}")
 
-    else:
+def exibir_pedidos_pendentes(pendentes):
+    """
+    Lista os itens pendentes em páginas. Filtro e ordenação rodam no servidor sobre o
+    resumo pré-calculado da versão dos dados; só a página visível é formatada e enviada.
+    """
+    resumo = pendentes.resumo()
+    if resumo['pedidos'] == 0:
         st.info("Não há pedidos com entrega pendente.")
-
-listar_pedidos_pendentes_detalhado(df)
-
+        return
+
+    st.warning(f"⚠️ Atenção! {resumo['pedidos']} pedidos estão com entrega pendente "
+               f"({resumo['pedidos_atrasados']} com a entrega prevista já vencida):")
+    if resumo['datas_invalidas']:
+        st.warning(f"⚠️ Atenção! {resumo['datas_invalidas']} itens pendentes estão sem data de emissão ou de "
+                   "entrega prevista válida. Verifique os dados.")
+    st.subheader("Pedidos Pendentes")
+
+    col_fornecedor, col_atraso, col_valor, col_ordem, col_sentido = st.columns([3, 1, 1, 1, 1])
+    with col_fornecedor:
+        fornecedor = st.selectbox("Fornecedor", ['todos'] + pendentes.fornecedores, key='pendentes_fornecedor')
+    with col_atraso:
+        atraso_minimo = st.number_input("Atraso Mínimo (dias)", value=None, step=1, key='pendentes_atraso')
+    with col_valor:
+        valor_minimo = st.number_input("Valor Mínimo (R$)", value=None, min_value=0.0, step=100.0, key='pendentes_valor')
+    with col_ordem:
+        ordenar_por = st.selectbox("Ordenar Por", list(ORDENACOES_PENDENTES), key='pendentes_ordem')
+    with col_sentido:
+        decrescente = st.radio("Ordem", ["Decrescente", "Crescente"], key='pendentes_sentido') == "Decrescente"
+
+    posicoes = pendentes.filtrar(fornecedor, atraso_minimo, valor_minimo, ORDENACOES_PENDENTES[ordenar_por], decrescente)
+    if len(posicoes) == 0:
+        st.info("Nenhum item pendente com os filtros selecionados.")
+    else:
+        col_tamanho, col_pagina = st.columns(2)
+        with col_tamanho:
+            tamanho_pagina = st.selectbox("Itens por Página", [25, 50, 100, 250], index=1, key='pendentes_tamanho')
+        n_paginas = -(-len(posicoes) // tamanho_pagina)
+        with col_pagina:
+            # A chave muda junto com os filtros: um widget novo começa na página 1.
+            chave_pagina = f"pendentes_pagina_{(fornecedor, atraso_minimo, valor_minimo, ordenar_por, decrescente, tamanho_pagina)}"
+            numero_pagina = st.number_input(f"Página (de {n_paginas})", min_value=1, max_value=n_paginas, value=1, step=1,
+                                            key=chave_pagina)
+
+        pagina = pendentes.pagina(posicoes, numero_pagina, tamanho_pagina)
+        for coluna in ['data emissao', 'data entrega prevista', 'data entrada']:
+            pagina[coluna] = pagina[coluna].dt.strftime('%d/%m/%Y')
+        # A página já vem ordenada por `pendentes.filtrar`; valor em texto como as datas.
+        pagina, config_colunas = formatar_colunas_moeda(pagina, ['valor liquido item'], manter_numerico=False)
+        st.dataframe(pagina, column_config=config_colunas, hide_index=True)
+        st.caption(f"{len(posicoes)} itens filtrados, somando {formatar_moeda(pendentes.valor(posicoes))}.")
+        # 'dias em atraso' muda com o dia, então a data entra na chave da exportação.
+        botoes_exportacao('pedidos_pendentes',
+                          (fornecedor, atraso_minimo, valor_minimo, ordenar_por, decrescente, datetime.now().date()),
+                          lambda: pendentes.pagina(posicoes, 1, len(posicoes)))
+
+    st.info(f"Valor Total dos Pedidos Pendentes: {formatar_moeda(resumo['valor_total'])}")
+
+with medicao.secao('Pedidos pendentes'):
+    exibir_pedidos_pendentes(versao_dados.pendentes)
 
 
-def calcular_variacao_percentual(row, preco_anterior_col, preco_atual_col):
-    preco_anterior = row[preco_anterior_col]
-    preco_atual = row[preco_atual_col]
-    if preco_anterior == 0 or preco_atual == 0:
-        return 0.0
-    return ((preco_atual - preco_anterior) / preco_anterior) * 100
 
 def aplicar_cor(val):
     if isinstance(val, (int, float)):
@@ -334,49 +402,21 @@ def aplicar_cor(val):
         return f'color: {color}'
     return ''
 
-if not df.empty:
-    ano_atual = df['ano'].max()
-    mes_atual = df[df['ano'] == ano_atual]['mes'].max()
-
-    ano_anterior = ano_atual
-    mes_anterior = mes_atual - 1
-    if mes_anterior < 1:
-        mes_anterior = 12
-        ano_anterior -= 1
-
-    df_atual = df[(df['ano'] == ano_atual) & (df['mes'] == mes_atual)]
-    df_anterior = df[(df['ano'] == ano_anterior) & (df['mes'] == mes_anterior)]
-
-    # Agrupar e obter a média do preço unitário e a soma da quantidade de cada produto no mês anterior
-    preco_anterior = df_anterior.groupby('descricao produto')['preco unitario liquido item'].mean().reset_index()
-    preco_anterior.rename(columns={'preco unitario liquido item': f'Preço Unitário {mes_anterior}/{ano_anterior}'}, inplace=True)
-    quantidade_anterior = df_anterior.groupby('descricao produto')['qtd pedido item'].sum().reset_index()
-    quantidade_anterior.rename(columns={'qtd pedido item': f'Quantidade {mes_anterior}/{ano_anterior}'}, inplace=True)
-
-    # Agrupar e obter a média do preço unitário e a soma da quantidade de cada produto no mês atual
-    preco_atual = df_atual.groupby('descricao produto')['preco unitario liquido item'].mean().reset_index()
-    preco_atual.rename(columns={'preco unitario liquido item': f'Preço Unitário {mes_atual}/{ano_atual}'}, inplace=True)
-    quantidade_atual = df_atual.groupby('descricao produto')['qtd pedido item'].sum().reset_index()
-    quantidade_atual.rename(columns={'qtd pedido item': f'Quantidade {mes_atual}/{ano_atual}'}, inplace=True)
-
-    # Merge dos DataFrames para ter a quantidade e o preço dos dois meses lado a lado
-    df_comparativo = pd.merge(quantidade_anterior, quantidade_atual, on='descricao produto', how='outer').fillna(0)
-    df_comparativo = pd.merge(df_comparativo, preco_anterior, on='descricao produto', how='left').fillna(0)
-    df_comparativo = pd.merge(df_comparativo, preco_atual, on='descricao produto', how='left').fillna(0)
-
-    # Calcular a variação percentual
-    coluna_preco_anterior = f'Preço Unitário {mes_anterior}/{ano_anterior}'
-    coluna_preco_atual = f'Preço Unitário {mes_atual}/{ano_atual}'
-
-    if coluna_preco_anterior in df_comparativo.columns and coluna_preco_atual in df_comparativo.columns:
-        df_comparativo['Variação Preço Unitário (%)'] = df_comparativo.apply(
-            lambda row: calcular_variacao_percentual(row, coluna_preco_anterior, coluna_preco_atual),
-            axis=1
+with medicao.secao('Comparativo de preços'):
+    if not df.empty:
+        ano_referencia = int(df['ano'].max())
+        mes_referencia = int(df[df['ano'] == ano_referencia]['mes'].max())
+
+        modo_comparacao = st.radio(
+            "Período de Comparação:",
+            list(MODOS_COMPARACAO),
+            horizontal=True
         )
+        periodos = periodos_comparacao(ano_referencia, mes_referencia, modo_comparacao)
+        df_comparativo = comparar_periodos(df, periodos)
 
-        # Formatar as colunas de preço
-        df_comparativo[coluna_preco_anterior] = df_comparativo[coluna_preco_anterior].apply(formatar_moeda)
-        df_comparativo[coluna_preco_atual] = df_comparativo[coluna_preco_atual].apply(formatar_moeda)
+        colunas_preco = [f'Preço Unitário {rotulo}' for rotulo, _ in periodos]
+        colunas_quantidade = [f'Quantidade {rotulo}' for rotulo, _ in periodos]
 
         # Criar o filtro de variação percentual
         filtro_percentual = st.radio(
@@ -385,53 +425,77 @@ if not df.empty:
             horizontal=True
         )
 
-        df_filtrado = df_comparativo.copy()
+        df_filtrado = df_comparativo
         if filtro_percentual == "Negativos":
             df_filtrado = df_filtrado[df_filtrado['Variação Preço Unitário (%)'] > 0]
         elif filtro_percentual == "Positivos":
             df_filtrado = df_filtrado[df_filtrado['Variação Preço Unitário (%)'] < 0]
 
         # Aplicar formatação para remover casas decimais nas colunas de quantidade
-        coluna_quantidade_anterior = f'Quantidade {mes_anterior}/{ano_anterior}'
-        coluna_quantidade_atual = f'Quantidade {mes_atual}/{ano_atual}'
-        if coluna_quantidade_anterior in df_filtrado.columns:
-            df_filtrado[coluna_quantidade_anterior] = df_filtrado[coluna_quantidade_anterior].astype(int)
-        if coluna_quantidade_atual in df_filtrado.columns:
-            df_filtrado[coluna_quantidade_atual] = df_filtrado[coluna_quantidade_atual].astype(int)
+        df_filtrado = df_filtrado.astype({coluna: int for coluna in colunas_quantidade})
+
+        with medicao.secao('Styler'):
+            # Aplicar estilo para colorir a coluna de variação NO DATAFRAME FILTRADO (ANTES da formatação para string)
+            df_styled = df_filtrado.style.map(aplicar_cor, subset=['Variação Preço Unitário (%)'])
 
-        # Aplicar estilo para colorir a coluna de variação NO DATAFRAME FILTRADO (ANTES da formatação para string)
-        df_styled = df_filtrado.style.applymap(aplicar_cor, subset=['Variação Preço Unitário (%)'])
+            # Formatar a coluna de variação percentual para exibição (DEPOIS da aplicação do estilo)
+            df_styled = df_styled.format({'Variação Preço Unitário (%)': '{:.2f}%'})
 
-        # Formatar a coluna de variação percentual para exibição (DEPOIS da aplicação do estilo)
-        df_styled = df_styled.format({'Variação Preço Unitário (%)': '{:.2f}%'})
+            st.subheader(f"Comparativo de Produtos Comprados em {periodos[0][0]} vs {periodos[-1][0]}:")
+            # Colunas de preço continuam numéricas (ordenação correta); o grid formata.
+            _, config_colunas = formatar_colunas_moeda(df_filtrado, colunas_preco)
+            st.dataframe(df_styled, column_config=config_colunas)
+        botoes_exportacao('comparativo_precos', (modo_comparacao, filtro_percentual), lambda tabela=df_filtrado: tabela)
 
-        st.subheader(f"Comparativo de Produtos Comprados em {mes_anterior}/{ano_anterior} vs {mes_atual}/{ano_atual}:")
-        st.dataframe(df_styled)
     else:
-        st.warning("Não foi possível encontrar as colunas de preço para comparação.")
+        st.info("Não há dados para análise de produtos com os filtros aplicados.")
+
+with medicao.secao('Cadência de compras'):
+    st.subheader("Análise de Prazo Médio e Frequência de Compra")
+    col_agrupamento, col_janelas = st.columns(2)
+    with col_agrupamento:
+        agrupamento_cadencia = st.radio("Agrupar Por:", ["Produto", "Fornecedor"], horizontal=True)
+    with col_janelas:
+        janelas_cadencia = st.multiselect("Janelas de Cadência (dias)", JANELAS_DIAS, default=[90])
+
+    chave_cadencia = 'descricao produto' if agrupamento_cadencia == "Produto" else 'fornecedor'
+    df_prazo_frequencia = calcular_cadencia_compras(df, chave=chave_cadencia, janelas=tuple(janelas_cadencia) or (90,))
+    if not df_prazo_frequencia.empty:
+        st.dataframe(df_prazo_frequencia, hide_index=True)
+        # As janelas contam a partir de hoje, então a data entra na chave da exportação.
+        botoes_exportacao('cadencia_compras', (chave_cadencia, tuple(janelas_cadencia), datetime.now().date()),
+                          lambda tabela=df_prazo_frequencia: tabela)
+    else:
+        st.info("Não há dados de compra nas janelas selecionadas para calcular o prazo médio e a frequência.")
 
-else:
-    st.info("Não há dados para análise de produtos com os filtros aplicados.")
 
-st.subheader("Análise de Prazo Médio e Frequência de Compra")
-df_prazo_frequencia = calcular_prazo_medio_e_frequencia(df.copy()) # Passe uma cópia para evitar modificações no DataFrame original
-if not df_prazo_frequencia.empty:
-    st.dataframe(df_prazo_frequencia)
-else:
-    st.info("Não há dados de compra nos últimos 3 meses para calcular o prazo médio e a frequência.")
+with medicao.secao('Melhores e piores preços'):
+    col_janela, col_top_n = st.columns(2)
+    with col_janela:
+        janela_dias = st.selectbox("Janela de Preços (dias)", JANELAS_DIAS, index=JANELAS_DIAS.index(90))
+    with col_top_n:
+        top_n_precos = st.number_input("Quantidade de Produtos", min_value=1, max_value=100, value=10)
 
+    st.subheader(f"Análise dos Melhores e Piores Preços (Últimos {janela_dias} Dias)")
+    df_melhores_precos, df_piores_precos = analisar_melhores_e_piores_negociacoes_precos(
+        versao_dados.precos_ordenados, dias=janela_dias, n=top_n_precos)
 
-st.subheader("Análise dos Melhores e Piores Preços (Últimos 90 Dias)")
-df_melhores_precos, df_piores_precos = analisar_melhores_e_piores_negociacoes_precos_ultimos_90_dias(df.copy())
+    if not df_melhores_precos.empty:
+        st.subheader(f"Top {top_n_precos} Melhores Preços Recentes")
+        st.dataframe(df_melhores_precos)
+        botoes_exportacao('melhores_precos', (janela_dias, top_n_precos, datetime.now().date()),
+                          lambda tabela=df_melhores_precos: tabela)
+    else:
+        st.info("Não há dados suficientes para identificar os melhores preços recentes.")
 
-if not df_melhores_precos.empty:
-    st.subheader("Top 10 Melhores Preços Recentes")
-    st.dataframe(df_melhores_precos)
-else:
-    st.info("Não há dados suficientes para identificar os melhores preços recentes.")
+    if not df_piores_precos.empty:
+        st.subheader(f"Top {top_n_precos} Piores Preços Recentes")
+        st.dataframe(df_piores_precos)
+        botoes_exportacao('piores_precos', (janela_dias, top_n_precos, datetime.now().date()),
+                          lambda tabela=df_piores_precos: tabela)
+    else:
+        st.info("Não há dados suficientes para identificar os piores preços recentes.")
 
-if not df_piores_precos.empty:
-    st.subheader("Top 10 Piores Preços Recentes")
-    st.dataframe(df_piores_precos)
-else:
-    st.info("Não há dados suficientes para identificar os piores preços recentes.")
+registro_desempenho = medicao.finalizar()
+if st.sidebar.checkbox("Exibir painel de desempenho"):
+    exibir_painel_desempenho(registro_desempenho, {'Gráficos': cache_graficos, 'Exportações': cache_exportacoes})
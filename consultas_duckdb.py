@@ -0,0 +1,236 @@
+"""
+Backend opcional de consultas em DuckDB embutido sobre Parquet particionado por ano e mês.
+
+Exemplo:
+    backend = BackendDuckDB('.cache_compra/particoes')
+    dados_compra.ao_publicar(backend.sincronizar)
+    dados_compra.atualizar()
+    consulta = backend.consulta(dados_compra.atual.numero)
+    consulta.metricas(ano=2025, mes='Mar')
+
+Cada versão dos dados é gravada em `ano=<ano>/mes=<mes>/parte-v<versão>.parquet`. Uma
+versão que só anexou linhas regrava apenas as partições que receberam linhas novas e
+reaproveita os arquivos das demais. As consultas de uma versão leem só a lista de
+arquivos dela, já podada pelos filtros de ano e mês, e o DuckDB empurra os demais
+predicados e a projeção de colunas para a leitura do Parquet: só o resultado, em
+geral pequeno, volta para o pandas.
+"""
+import collections
+import os
+import shutil
+import threading
+import weakref
+
+import numpy as np
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+from analise_compras import _escrever_atomico, _resolver_filtros, meses_abreviados_num_para_abv
+from instrumentacao import cronometrado
+
+VERSOES_MANTIDAS = 2
+COLUNAS_PARTICAO = ['ano', 'mes']
+
+
+def _coluna(nome):
+    return '"' + nome.replace('"', '""') + '"'
+
+
+def _texto(valor):
+    return "'" + str(valor).replace("'", "''") + "'"
+
+
+class ConsultaDuckDB:
+    """
+    Consultas sobre as partições de uma versão dos dados.
+
+    `metricas`, `contagem_status`, `valor_por_mes` e `top_fornecedores` devolvem o
+    mesmo que os métodos de `CuboCompra`, e `aplicar_filtros` o mesmo que
+    `analise_compras.aplicar_filtros` com índice, então a consulta pode substituir o
+    cubo no painel. `modelo` é o DataFrame vazio com as colunas e os tipos da versão.
+    """
+
+    def __init__(self, conexao, particoes, numero, modelo):
+        self._conexao = conexao
+        self.particoes = particoes
+        self.numero = numero
+        self.modelo = modelo
+
+    def arquivos(self, filtros):
+        """Arquivos das partições compatíveis com os filtros de ano e mês já resolvidos."""
+        return [caminho for (ano, mes), caminho in sorted(self.particoes.items())
+                if filtros.get('ano', ano) == ano and filtros.get('mes', mes) == mes]
+
+    def _consultar(self, selecao, filtros, condicoes_extras=(), final=''):
+        filtros_resolvidos, mes_invalido = _resolver_filtros(**filtros)
+        arquivos = self.arquivos(filtros_resolvidos)
+        condicoes = [f'{_coluna(coluna)} = ?' for coluna in filtros_resolvidos] + list(condicoes_extras)
+        if not arquivos:
+            # Nenhuma partição no recorte: lê o esquema de uma delas para devolver o
+            # resultado vazio com as mesmas colunas.
+            arquivos = sorted(self.particoes.values())[:1]
+            condicoes.append('FALSE')
+        origem = f"read_parquet([{', '.join(map(_texto, arquivos))}], hive_partitioning = true)"
+        sql = f"SELECT {selecao} FROM {origem}"
+        if condicoes:
+            sql += ' WHERE ' + ' AND '.join(condicoes)
+        # Um cursor por consulta: a conexão é compartilhada entre as threads das sessões.
+        cursor = self._conexao.cursor()
+        try:
+            return cursor.execute(sql + final, list(filtros_resolvidos.values())).df(), mes_invalido
+        finally:
+            cursor.close()
+
+    @cronometrado
+    def metricas(self, **filtros):
+        """Mesmo retorno de `calcular_metricas`, agregado dentro do DuckDB."""
+        resultado, _ = self._consultar(
+            "COUNT(DISTINCT numeropedido), COALESCE(SUM(\"valor liquido item\"), 0), "
+            "COALESCE(SUM(\"qtd pedido item\"), 0), "
+            "COUNT(DISTINCT numeropedido) FILTER (WHERE \"situacao pedido\" = 'fechado pedido chegou'), "
+            "COUNT(DISTINCT numeropedido) FILTER (WHERE \"situacao pedido\" = 'pendente')", filtros)
+        pedidos, valor, itens, entregues, pendentes = resultado.iloc[0].tolist()
+        return int(pedidos), float(valor), int(itens), int(entregues), int(pendentes)
+
+    @cronometrado
+    def contagem_status(self, **filtros):
+        resultado, _ = self._consultar('"status pedido", COUNT(*) AS quantidade', filtros,
+                                       ['"status pedido" IS NOT NULL'], ' GROUP BY 1 ORDER BY 2 DESC, 1')
+        return resultado.astype({'quantidade': int})
+
+    @cronometrado
+    def valor_por_mes(self, **filtros):
+        resultado, _ = self._consultar('ano, mes, SUM("valor liquido item") AS "valor liquido item"', filtros,
+                                       final=' GROUP BY 1, 2 ORDER BY 1, 2')
+        resultado['mes_nome'] = resultado['mes'].map(meses_abreviados_num_para_abv)
+        return resultado[['ano', 'mes_nome', 'valor liquido item']]
+
+    @cronometrado
+    def top_fornecedores(self, n=10, **filtros):
+        resultado, _ = self._consultar('fornecedor, SUM("valor liquido item") AS "valor liquido item"', filtros,
+                                       ['fornecedor IS NOT NULL'], f' GROUP BY 1 ORDER BY 2 DESC, 1 LIMIT {int(n)}')
+        return resultado
+
+    @cronometrado
+    def aplicar_filtros(self, ano='todos', mes='todos', usuario='todos', situacao='todos', tipo_fornecedor='todos',
+                        colunas=None):
+        """
+        Linhas de item do recorte, na ordem original, com as mesmas colunas (na mesma
+        ordem), tipos e índice (posição da linha na versão) de `aplicar_filtros` com
+        índice: as exportações saem iguais nos dois backends. Com `colunas` só essas
+        colunas são lidas do Parquet (mais 'linha').
+        """
+        filtros = dict(ano=ano, mes=mes, usuario=usuario, situacao=situacao, tipo_fornecedor=tipo_fornecedor)
+        lidas = [coluna for coluna in (colunas or self.modelo.columns) if coluna != 'mes_nome']
+        if colunas is not None and 'mes_nome' in colunas and 'mes' not in lidas:
+            lidas.append('mes')
+        selecao = ', '.join(map(_coluna, ['linha'] + lidas))
+        resultado, mes_invalido = self._consultar(selecao, filtros, final=' ORDER BY linha')
+        resultado = resultado.astype(self.modelo.dtypes[lidas].to_dict())
+        resultado.index = resultado.pop('linha').to_numpy(dtype=np.int64)
+        if colunas is None or 'mes_nome' in colunas:
+            # Como em `aplicar_filtros`: mês não reconhecido deixa 'mes_nome' vazio (None).
+            resultado['mes_nome'] = None if mes_invalido else resultado['mes'].map(meses_abreviados_num_para_abv).astype(
+                self.modelo['mes_nome'].dtype)
+        return resultado[[coluna for coluna in self.modelo.columns if colunas is None or coluna in colunas]]
+
+
+class BackendDuckDB:
+    """
+    Mantém as partições Parquet das últimas versões dos dados e abre consultas sobre elas.
+
+    `sincronizar` tem a assinatura de `DadosCompra.ao_publicar`: as partições de uma
+    versão ficam prontas antes de ela ser publicada. O diretório é de uso exclusivo do
+    processo e é limpo ao criar o backend.
+
+    Os arquivos de uma versão fora das `VERSOES_MANTIDAS` mais recentes só são
+    removidos quando nenhuma `ConsultaDuckDB` dela continua viva (por exemplo, a de um
+    rerun ainda em andamento ou a guardada por uma exportação adiada).
+    """
+
+    def __init__(self, diretorio):
+        if duckdb is None:
+            raise ImportError("O backend de consultas DuckDB precisa do pacote 'duckdb' (pip install duckdb).")
+        self.diretorio = diretorio
+        shutil.rmtree(diretorio, ignore_errors=True)
+        os.makedirs(diretorio, exist_ok=True)
+        self._conexao = duckdb.connect()
+        # {número da versão: ({(ano, mes): arquivo}, DataFrame vazio com os tipos da versão)}
+        self._versoes = {}
+        self._consultas_vivas = collections.Counter()
+        # Versões de consultas já coletadas pelo GC. O finalizador só anota (ele pode rodar
+        # em qualquer thread, inclusive com o lock tomado); a contagem é baixada depois.
+        self._liberadas = collections.deque()
+        self._lock = threading.Lock()
+
+    def _gravar_particao(self, df, posicoes, ano, mes, numero):
+        colunas = [coluna for coluna in df.columns if coluna not in COLUNAS_PARTICAO + ['mes_nome']]
+        parte = df[colunas].take(posicoes).reset_index(drop=True)
+        parte.insert(0, 'linha', posicoes)
+        diretorio = os.path.join(self.diretorio, f'ano={ano}', f'mes={mes}')
+        os.makedirs(diretorio, exist_ok=True)
+        caminho = os.path.join(diretorio, f'parte-v{numero}.parquet')
+        _escrever_atomico(caminho, lambda tmp: parte.to_parquet(tmp, index=False))
+        return caminho
+
+    @cronometrado
+    def sincronizar(self, versao, anterior=None):
+        """Grava as partições de `versao` (só as tocadas, se ela apenas anexou linhas a `anterior`)."""
+        df = versao.df
+        base = None
+        if anterior is not None and versao.anexo_desde is not None:
+            base, _ = self._versoes.get(anterior.numero, (None, None))
+        particoes = dict(base) if base is not None else {}
+        inicio = versao.anexo_desde if base is not None else 0
+
+        chaves = df['ano'].to_numpy(dtype=np.int64) * 100 + df['mes'].to_numpy(dtype=np.int64)
+        tocadas = set(np.unique(chaves[inicio:]).tolist())
+        ordem = np.argsort(chaves, kind='stable')
+        valores, inicios = np.unique(chaves[ordem], return_index=True)
+        for chave, posicoes in zip(valores.tolist(), np.split(ordem, inicios[1:])):
+            if chave in tocadas:
+                ano, mes = divmod(chave, 100)
+                particoes[(ano, mes)] = self._gravar_particao(df, posicoes, ano, mes, versao.numero)
+
+        with self._lock:
+            self._versoes[versao.numero] = (particoes, df.iloc[:0])
+            sem_uso = self._descartar_versoes()
+        self._remover_arquivos(sem_uso)
+
+    def _descartar_versoes(self):
+        # Chamado com o lock: tira de `_versoes` as versões antigas sem consulta viva e
+        # devolve os arquivos delas que nenhuma versão mantida usa.
+        while self._liberadas:
+            numero = self._liberadas.popleft()
+            self._consultas_vivas[numero] -= 1
+            if self._consultas_vivas[numero] <= 0:
+                del self._consultas_vivas[numero]
+        recentes = sorted(self._versoes)[-VERSOES_MANTIDAS:]
+        candidatos = set()
+        for numero in [numero for numero in self._versoes if numero not in recentes]:
+            if numero not in self._consultas_vivas:
+                candidatos.update(self._versoes.pop(numero)[0].values())
+        em_uso = {caminho for particoes, _ in self._versoes.values() for caminho in particoes.values()}
+        return candidatos - em_uso
+
+    def _remover_arquivos(self, caminhos):
+        for caminho in caminhos:
+            try:
+                os.remove(caminho)
+            except OSError:
+                pass
+
+    def consulta(self, numero):
+        """`ConsultaDuckDB` da versão `numero`, ou None se ela não foi sincronizada ou está vazia."""
+        with self._lock:
+            sem_uso = self._descartar_versoes()
+            particoes, modelo = self._versoes.get(numero, (None, None))
+            consulta = ConsultaDuckDB(self._conexao, particoes, numero, modelo) if particoes else None
+            if consulta is not None:
+                self._consultas_vivas[numero] += 1
+                weakref.finalize(consulta, self._liberadas.append, numero)
+        self._remover_arquivos(sem_uso)
+        return consulta
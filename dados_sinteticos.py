@@ -0,0 +1,196 @@
+"""
+Gera dados de compra sintéticos com o mesmo esquema de 29 colunas de df_compra.csv.
+
+Exemplo:
+    python dados_sinteticos.py 1000000 --saida sintetico_1000000.csv
+
+As cardinalidades de fornecedor, produto, usuário e cidade crescem com a raiz do
+volume (a partir das observadas no CSV real), a popularidade de produtos e
+fornecedores segue uma distribuição de Zipf e os itens são agrupados em pedidos
+com cerca de 4,5 itens em média. A geração é feita em lotes, então 10M de linhas
+não precisam caber na memória de uma vez.
+"""
+import argparse
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+COLUNAS = [
+    'numeropedido', 'data emissao', 'data entrega prevista', 'data entrada', 'codigofornecedor', 'fornecedor',
+    'cidade fornecedor', 'total itens', 'valor bruto total itens', 'situacao pedido', 'usuario', 'prazo',
+    'codigoprodutoitem', 'descricao produto', 'qtd pedido item', 'qtd bonificacao item', 'qtd pendente item',
+    'preco unitario item', 'qtd falta item', 'qtd faturada item', 'valor desconto item', 'valor bruto item',
+    'valor liquido item', 'preco unitario liquido item', 'tipo produto', 'mes', 'ano', 'status pedido',
+    'tipo fornecedor',
+]
+PRAZOS = ['30/45/60', '28/35/42', '30', '30/45', '28/35/42/49', '20/30/40/50/60', '30/45/60/75', '30/40/50/60']
+PESOS_PRAZOS = [0.43, 0.15, 0.13, 0.1, 0.08, 0.06, 0.03, 0.02]
+TIPOS_PRODUTO = ['MATERIAL HOSPITALAR', 'MEDICAMENTOS', 'OUTROS']
+SITUACOES = ['fechado pedido chegou', 'aguardando faturamento', 'pendente']
+PESOS_SITUACOES = [0.93, 0.04, 0.03]
+ITENS_POR_PEDIDO = 4.5
+LINHAS_REFERENCIA = 900
+
+
+def _cardinalidade(base, n_linhas, minimo, maximo):
+    return int(np.clip(round(base * (n_linhas / LINHAS_REFERENCIA) ** 0.5), minimo, maximo))
+
+
+def _escolha_zipf(rng, n_opcoes, tamanho, expoente=1.1):
+    pesos = 1.0 / np.arange(1, n_opcoes + 1) ** expoente
+    return rng.choice(n_opcoes, size=tamanho, p=pesos / pesos.sum())
+
+
+def _formatar_datas(datas):
+    # Poucas datas distintas se repetem em milhões de linhas: formata só as únicas.
+    unicas, posicoes = np.unique(datas, return_inverse=True)
+    return pd.Series(unicas).dt.strftime('%d/%m/%Y').to_numpy(dtype=object)[posicoes]
+
+
+class GeradorCompras:
+    """
+    Catálogos fixos (fornecedores, produtos, usuários) e geração de pedidos em lotes.
+
+    Os catálogos dependem só de `n_linhas` e da `semente`, então lotes diferentes do
+    mesmo conjunto compartilham os mesmos fornecedores e produtos.
+    """
+
+    def __init__(self, n_linhas, semente=0, inicio=None, fim=None):
+        self.rng = np.random.default_rng(semente)
+        self.fim = fim or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.inicio = inicio or self.fim - timedelta(days=3 * 365)
+
+        n_fornecedores = _cardinalidade(64, n_linhas, 64, 5000)
+        n_cidades = max(33, n_fornecedores // 2)
+        n_produtos = _cardinalidade(535, n_linhas, 535, 60000)
+        n_usuarios = int(np.clip(round(3 * (n_linhas / LINHAS_REFERENCIA) ** 0.25), 3, 40))
+
+        rng = self.rng
+        self.fornecedores = np.array([f'FORNECEDOR {i:05d}' for i in range(n_fornecedores)], dtype=object)
+        self.codigos_fornecedor = rng.permutation(np.arange(1, 10 * n_fornecedores))[:n_fornecedores]
+        cidades = np.array([f'CIDADE {i:04d}' for i in range(n_cidades)], dtype=object)
+        self.cidades_fornecedor = cidades[rng.integers(0, n_cidades, n_fornecedores)]
+        self.tipos_fornecedor = np.where(rng.random(n_fornecedores) < 0.9, 'externo', 'interno').astype(object)
+
+        self.produtos = np.array([f'PRODUTO {i:06d} UN' for i in range(n_produtos)], dtype=object)
+        self.codigos_produto = rng.permutation(np.arange(1, 10 * n_produtos))[:n_produtos]
+        self.tipos_produto = np.array(TIPOS_PRODUTO, dtype=object)[rng.choice(3, n_produtos, p=[0.5, 0.4, 0.1])]
+        # Preço base por produto com cauda longa (mediana ~3, alguns itens na casa das centenas).
+        self.precos_base = np.round(np.exp(rng.normal(1.1, 1.6, n_produtos)), 2).clip(0.01, 5000)
+
+        self.usuarios = np.array([f'USUARIO {i:02d}' for i in range(n_usuarios)], dtype=object)
+        self.proximo_pedido = 1
+
+    def gerar_lote(self, n_linhas):
+        """Gera exatamente `n_linhas` linhas de item e devolve o DataFrame."""
+        rng = self.rng
+        # Sorteia pedidos de sobra e corta no ponto em que a soma de itens chega a n_linhas.
+        itens = np.empty(0, dtype=np.int64)
+        while itens.sum() < n_linhas:
+            n_extra = int(np.ceil(n_linhas / ITENS_POR_PEDIDO * 1.2)) + 10
+            itens = np.concatenate((itens, np.minimum(rng.geometric(1 / ITENS_POR_PEDIDO, n_extra), 60)))
+        acumulado = np.cumsum(itens)
+        ultimo = int(np.searchsorted(acumulado, n_linhas))
+        itens = itens[:ultimo + 1]
+        itens[-1] -= acumulado[ultimo] - n_linhas
+        n_pedidos = len(itens)
+
+        numeros = np.arange(self.proximo_pedido, self.proximo_pedido + n_pedidos)
+        self.proximo_pedido += n_pedidos
+        dias = (self.fim - self.inicio).days
+        emissao = np.datetime64(self.inicio, 'D') + rng.integers(0, dias + 1, n_pedidos)
+        prevista = emissao + rng.integers(7, 46, n_pedidos)
+        fornecedor = _escolha_zipf(rng, len(self.fornecedores), n_pedidos)
+        usuario = _escolha_zipf(rng, len(self.usuarios), n_pedidos, expoente=0.8)
+        situacao = rng.choice(3, n_pedidos, p=PESOS_SITUACOES)
+        prazo = rng.choice(len(PRAZOS), n_pedidos, p=PESOS_PRAZOS)
+
+        # Expande atributos do pedido para os itens.
+        pedido_item = np.repeat(np.arange(n_pedidos), itens)
+        produto = _escolha_zipf(rng, len(self.produtos), len(pedido_item))
+        quantidade = np.maximum(1, np.round(np.exp(rng.normal(6.3, 2.0, len(pedido_item))))).astype(np.int64)
+        preco = np.round(self.precos_base[produto] * rng.uniform(0.9, 1.1, len(pedido_item)), 2).clip(0.01)
+        valor_bruto = np.round(quantidade * preco, 2)
+        desconto = np.where(rng.random(len(pedido_item)) < 0.03, np.round(valor_bruto * rng.uniform(0.01, 0.05, len(pedido_item)), 2), 0.0)
+        valor_liquido = np.round(valor_bruto - desconto, 2)
+
+        situacao_item = situacao[pedido_item]
+        fechado = situacao_item == 0
+        # Pedidos fechados: ~2% dos itens ainda marcados como entrega pendente.
+        entrada = prevista[pedido_item] + rng.integers(-10, 11, len(pedido_item))
+        recebido = fechado & (rng.random(len(pedido_item)) > 0.02) & (entrada <= np.datetime64(self.fim, 'D'))
+        faturado = fechado & (rng.random(len(pedido_item)) < 0.5)
+
+        valor_bruto_pedido = np.bincount(pedido_item, weights=valor_bruto, minlength=n_pedidos)
+        emissao_item = emissao[pedido_item]
+        datas_entrada = _formatar_datas(entrada.astype('datetime64[ns]'))
+        datas_entrada[~recebido] = np.nan
+        emissao_ts = pd.DatetimeIndex(emissao_item.astype('datetime64[ns]'))
+
+        f = fornecedor[pedido_item]
+        return pd.DataFrame({
+            'numeropedido': numeros[pedido_item],
+            'data emissao': _formatar_datas(emissao_item.astype('datetime64[ns]')),
+            'data entrega prevista': _formatar_datas(prevista[pedido_item].astype('datetime64[ns]')),
+            'data entrada': datas_entrada,
+            'codigofornecedor': self.codigos_fornecedor[f],
+            'fornecedor': self.fornecedores[f],
+            'cidade fornecedor': self.cidades_fornecedor[f],
+            'total itens': itens[pedido_item],
+            'valor bruto total itens': np.round(valor_bruto_pedido[pedido_item], 2),
+            'situacao pedido': np.array(SITUACOES, dtype=object)[situacao_item],
+            'usuario': self.usuarios[usuario[pedido_item]],
+            'prazo': np.array(PRAZOS, dtype=object)[prazo[pedido_item]],
+            'codigoprodutoitem': self.codigos_produto[produto],
+            'descricao produto': self.produtos[produto],
+            'qtd pedido item': quantidade,
+            'qtd bonificacao item': 0,
+            'qtd pendente item': np.where(fechado, 0, quantidade),
+            'preco unitario item': preco,
+            'qtd falta item': np.where(fechado & ~faturado, quantidade, 0).astype(float),
+            'qtd faturada item': np.where(faturado, quantidade, 0),
+            'valor desconto item': desconto,
+            'valor bruto item': valor_bruto,
+            'valor liquido item': valor_liquido,
+            'preco unitario liquido item': np.round(valor_liquido / quantidade, 2),
+            'tipo produto': self.tipos_produto[produto],
+            'mes': emissao_ts.month,
+            'ano': emissao_ts.year,
+            'status pedido': np.where(recebido, 'recebido', 'entrega pendente').astype(object),
+            'tipo fornecedor': self.tipos_fornecedor[f],
+        }, columns=COLUNAS)
+
+
+def gerar_dados_sinteticos(n_linhas, semente=0, inicio=None, fim=None):
+    """Gera `n_linhas` linhas sintéticas em memória."""
+    return GeradorCompras(n_linhas, semente, inicio, fim).gerar_lote(n_linhas)
+
+
+def escrever_csv_sintetico(caminho, n_linhas, semente=0, tamanho_lote=1_000_000, inicio=None, fim=None):
+    """Grava `n_linhas` linhas sintéticas em `caminho`, gerando e anexando um lote por vez."""
+    gerador = GeradorCompras(n_linhas, semente, inicio, fim)
+    restante = n_linhas
+    primeiro = True
+    while restante > 0:
+        lote = gerador.gerar_lote(min(tamanho_lote, restante))
+        lote.to_csv(caminho, mode='w' if primeiro else 'a', header=primeiro, index=False)
+        restante -= len(lote)
+        primeiro = False
+    return caminho
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('linhas', type=int, help='Quantidade de linhas de item.')
+    parser.add_argument('--saida', help="CSV de saída; padrão 'sintetico_<linhas>.csv'.")
+    parser.add_argument('--semente', type=int, default=0)
+    parser.add_argument('--tamanho-lote', type=int, default=1_000_000)
+    args = parser.parse_args()
+    caminho = args.saida or f'sintetico_{args.linhas}.csv'
+    escrever_csv_sintetico(caminho, args.linhas, args.semente, args.tamanho_lote)
+    print(f"{args.linhas} linhas gravadas em '{caminho}'.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""
+Exportação de tabelas do painel para CSV, Parquet e XLSX, gerada em partes.
+
+Exemplo:
+    partes = gerar_exportacao(df_filtrado, 'CSV')          # gerador de bytes
+    with open('selecao.csv', 'wb') as arquivo:
+        for parte in partes:
+            arquivo.write(parte)
+
+O arquivo sai em fatias de `TAMANHO_FATIA` linhas: só a fatia atual é formatada
+por vez. `exportar_em_cache` grava as partes num arquivo temporário em disco e guarda
+o caminho num `CacheLRU`, para repetir a mesma exportação (mesma versão dos dados e
+mesmos filtros) sem gerar de novo; o cache não guarda bytes em memória. Quem serve
+o arquivo pode materializá-lo: o `st.download_button` lê o arquivo inteiro e mantém o
+payload em memória enquanto o download estiver disponível.
+"""
+import io
+import os
+import tempfile
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+TAMANHO_FATIA = 50_000
+# Limite de linhas de uma planilha do Excel, descontando o cabeçalho.
+LINHAS_POR_PLANILHA = 1_048_575
+TAMANHO_BLOCO_ARQUIVO = 1 << 20
+FORMATO_DATA = '%d/%m/%Y'
+
+FORMATOS_EXPORTACAO = {
+    'CSV': ('csv', 'text/csv'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'XLSX': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+
+def formatos_disponiveis():
+    """Formatos de `FORMATOS_EXPORTACAO` cujas dependências estão instaladas."""
+    return [formato for formato in FORMATOS_EXPORTACAO if formato != 'XLSX' or openpyxl is not None]
+
+
+def _fatias(df, tamanho_fatia):
+    for inicio in range(0, len(df), tamanho_fatia):
+        yield df.iloc[inicio:inicio + tamanho_fatia]
+
+
+def _gerar_csv(df, tamanho_fatia):
+    # Mesmo formato de data do CSV de origem; o cabeçalho só vai na primeira parte.
+    if df.empty:
+        yield df.to_csv(index=False).encode('utf-8')
+    for numero, fatia in enumerate(_fatias(df, tamanho_fatia)):
+        yield fatia.to_csv(index=False, header=numero == 0, date_format=FORMATO_DATA).encode('utf-8')
+
+
+class _SaidaEmPartes(io.RawIOBase):
+    """Destino de escrita que acumula os bytes até `drenar` e informa a posição total escrita."""
+
+    def __init__(self):
+        self._partes = []
+        self._posicao = 0
+
+    def writable(self):
+        return True
+
+    def write(self, dados):
+        self._partes.append(bytes(dados))
+        self._posicao += len(dados)
+        return len(dados)
+
+    def tell(self):
+        # O ParquetWriter grava no rodapé os deslocamentos obtidos por tell().
+        return self._posicao
+
+    def drenar(self):
+        dados = b''.join(self._partes)
+        self._partes.clear()
+        return dados
+
+
+def _gerar_parquet(df, tamanho_fatia):
+    # Um row group por fatia; cada row group é repassado assim que é escrito.
+    saida = _SaidaEmPartes()
+    esquema = pa.Schema.from_pandas(df, preserve_index=False)
+    with pq.ParquetWriter(saida, esquema) as escritor:
+        for fatia in _fatias(df, tamanho_fatia):
+            escritor.write_table(pa.Table.from_pandas(fatia, schema=esquema, preserve_index=False))
+            yield saida.drenar()
+    yield saida.drenar()
+
+
+def _gerar_xlsx(df, tamanho_fatia):
+    # XLSX é um zip que só fica completo no fim: as linhas vão para a planilha em modo
+    # write_only (o openpyxl as descarrega em arquivo temporário) e o arquivo salvo é
+    # lido de volta em blocos.
+    if openpyxl is None:
+        raise ImportError("A exportação em XLSX precisa do pacote 'openpyxl' (pip install openpyxl).")
+    pasta = openpyxl.Workbook(write_only=True)
+    planilha = None
+    linhas_na_planilha = LINHAS_POR_PLANILHA
+    for fatia in _fatias(df, tamanho_fatia):
+        fatia = fatia.astype(object).where(fatia.notna(), None)
+        for linha in fatia.itertuples(index=False, name=None):
+            if linhas_na_planilha == LINHAS_POR_PLANILHA:
+                planilha = pasta.create_sheet(f'dados {len(pasta.worksheets) + 1}' if planilha else 'dados')
+                planilha.append(list(map(str, df.columns)))
+                linhas_na_planilha = 0
+            planilha.append(linha)
+            linhas_na_planilha += 1
+    if planilha is None:
+        pasta.create_sheet('dados').append(list(map(str, df.columns)))
+
+    descritor, caminho = tempfile.mkstemp(suffix='.xlsx')
+    os.close(descritor)
+    try:
+        pasta.save(caminho)
+        with open(caminho, 'rb') as arquivo:
+            while bloco := arquivo.read(TAMANHO_BLOCO_ARQUIVO):
+                yield bloco
+    finally:
+        os.remove(caminho)
+
+
+GERADORES = {'CSV': _gerar_csv, 'Parquet': _gerar_parquet, 'XLSX': _gerar_xlsx}
+
+
+def gerar_exportacao(df, formato, tamanho_fatia=TAMANHO_FATIA):
+    """
+    Gera o arquivo de `df` no formato pedido, em partes.
+
+    Args:
+        df (pd.DataFrame): Tabela a exportar (o índice não é exportado).
+        formato (str): Uma das chaves de `FORMATOS_EXPORTACAO`.
+        tamanho_fatia (int): Linhas formatadas por vez.
+
+    Returns:
+        generator: Partes do arquivo em bytes, na ordem.
+    """
+    if formato not in GERADORES:
+        raise ValueError(f"Formato de exportação desconhecido: {formato!r}. Use um de {list(GERADORES)}.")
+    return GERADORES[formato](df, tamanho_fatia)
+
+
+def remover_arquivo_exportado(chave, caminho):
+    """Apaga um arquivo de `exportar_em_cache`; tem a assinatura de `CacheLRU(ao_remover=...)`."""
+    try:
+        os.remove(caminho)
+    except OSError:
+        # No Windows um arquivo ainda aberto por outro download não pode ser apagado;
+        # ele fica no diretório até a próxima limpeza.
+        pass
+
+
+class _ArquivoTemporario(io.FileIO):
+    """Arquivo aberto para leitura que é apagado ao ser fechado (ou coletado pelo GC)."""
+
+    def __init__(self, caminho):
+        super().__init__(caminho, 'rb')
+        self._caminho = caminho
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            remover_arquivo_exportado(None, self._caminho)
+
+
+def exportar_em_cache(cache, chave, gerar, diretorio):
+    """
+    Arquivo identificado por `chave`, aberto para leitura: o do cache, se já exportado;
+    senão as partes de `gerar()` são gravadas num arquivo novo em `diretorio`, que
+    entra no cache pelo caminho, com o tamanho em disco. Exportações maiores que o
+    limite do cache não são guardadas e o arquivo é apagado quando for fechado.
+
+    Args:
+        cache (CacheLRU): Cache dos caminhos, criado com
+                          `ao_remover=remover_arquivo_exportado`.
+        chave (tuple): Identifica a exportação, ex. (versão dos dados, tabela, filtros, formato).
+        gerar (callable): Sem argumentos; devolve o gerador das partes.
+        diretorio (str): Onde os arquivos exportados são gravados.
+
+    Returns:
+        file: Arquivo binário aberto no início; quem recebe deve fechá-lo.
+    """
+    caminho = cache.obter(chave)
+    if caminho is not None:
+        try:
+            return open(caminho, 'rb')
+        except OSError:
+            pass  # Despejado e apagado depois da consulta ao cache: gera de novo.
+
+    os.makedirs(diretorio, exist_ok=True)
+    descritor, caminho = tempfile.mkstemp(prefix='exportacao_', dir=diretorio)
+    tamanho = 0
+    try:
+        with os.fdopen(descritor, 'wb') as arquivo:
+            for parte in gerar():
+                arquivo.write(parte)
+                tamanho += len(parte)
+    except BaseException:
+        remover_arquivo_exportado(chave, caminho)
+        raise
+    if tamanho > cache.limite_bytes:
+        return _ArquivoTemporario(caminho)
+    # Abre antes de publicar no cache: um despejo logo depois não tira o arquivo de quem
+    # já o está lendo.
+    arquivo = open(caminho, 'rb')
+    cache.guardar(chave, caminho, tamanho)
+    return arquivo
@@ -0,0 +1,118 @@
+"""
+Gera em lote os relatórios do painel de compras para várias combinações de filtros.
+
+Exemplo:
+    python gerar_relatorios.py --anos 2025 --meses '*' --usuarios todos '*' --saida relatorios
+
+Cada opção de filtro aceita uma lista de valores; 'todos' é o mesmo valor do seletor
+do painel e '*' expande para cada valor presente nos dados. As combinações são
+distribuídas entre processos, e cada processo carrega o snapshot Parquet uma vez.
+"""
+import argparse
+import itertools
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+
+from analise_compras import (
+    CAMINHO_CSV, DIRETORIO_CACHE, JANELAS_DIAS, MODOS_COMPARACAO, DadosCompra, gerar_relatorios,
+    meses_abreviados_num_para_abv,
+)
+
+DIMENSOES_FILTRO = [
+    ('ano', 'anos', 'ano'),
+    ('mes', 'meses', 'mes'),
+    ('usuario', 'usuarios', 'usuario'),
+    ('situacao', 'situacoes', 'situacao pedido'),
+    ('tipo_fornecedor', 'tipos', 'tipo fornecedor'),
+]
+
+_dados = None
+
+
+def _valores_dimensao(df, parametro, coluna, valores):
+    expandidos = []
+    for valor in valores:
+        if valor != '*':
+            expandidos.append(valor)
+        elif parametro == 'mes':
+            expandidos.extend(meses_abreviados_num_para_abv[m] for m in sorted(df[coluna].dropna().unique()))
+        else:
+            expandidos.extend(sorted(df[coluna].dropna().unique().tolist()))
+    return list(dict.fromkeys(expandidos))
+
+
+def combinacoes_filtros(df, args):
+    """Produto cartesiano dos valores pedidos em cada dimensão de filtro."""
+    listas = [_valores_dimensao(df, parametro, coluna, getattr(args, opcao))
+              for parametro, opcao, coluna in DIMENSOES_FILTRO]
+    nomes = [parametro for parametro, _, _ in DIMENSOES_FILTRO]
+    return [dict(zip(nomes, valores)) for valores in itertools.product(*listas)]
+
+
+def _nome_diretorio(filtros):
+    nome = '_'.join(f'{chave}={valor}' for chave, valor in filtros.items())
+    return re.sub(r'[^\w.=-]+', '-', nome)
+
+
+def _iniciar_processo(caminho_csv, diretorio_cache):
+    global _dados
+    _dados = DadosCompra(caminho_csv, diretorio_cache)
+    _dados.atualizar()
+
+
+def _processar(tarefa):
+    filtros, diretorio_saida, opcoes = tarefa
+    relatorios = gerar_relatorios(_dados.df, filtros, indice=_dados.indice, **opcoes)
+    destino = os.path.join(diretorio_saida, _nome_diretorio(filtros))
+    os.makedirs(destino, exist_ok=True)
+    for nome, tabela in relatorios.items():
+        tabela.to_csv(os.path.join(destino, f'{nome}.csv'), index=False)
+    return dict(filtros, **relatorios['metricas'].to_dict('records')[0])
+
+
+def _argumentos():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--csv', default=CAMINHO_CSV, help='CSV exportado de compras.')
+    parser.add_argument('--cache', default=DIRETORIO_CACHE, help='Diretório do snapshot Parquet.')
+    parser.add_argument('--saida', default='relatorios', help='Diretório onde os relatórios são gravados.')
+    for parametro, opcao, _ in DIMENSOES_FILTRO:
+        parser.add_argument(f'--{opcao}', nargs='+', default=['todos'],
+                            help=f"Valores de {parametro} ('todos' ou '*' para cada valor dos dados).")
+    parser.add_argument('--modo-comparacao', default='Mês anterior', choices=list(MODOS_COMPARACAO))
+    parser.add_argument('--janelas', nargs='+', type=int, default=list(JANELAS_DIAS),
+                        help='Janelas em dias da análise de cadência.')
+    parser.add_argument('--dias-precos', type=int, default=90, help='Janela em dias da análise de preços.')
+    parser.add_argument('--top-n', type=int, default=10, help='Produtos em cada lista de melhores/piores preços.')
+    parser.add_argument('--hoje', type=lambda texto: datetime.strptime(texto, '%Y-%m-%d'), default=None,
+                        help='Data de referência das janelas (AAAA-MM-DD); padrão: hoje.')
+    parser.add_argument('--processos', type=int, default=os.cpu_count(), help='Quantidade de processos.')
+    return parser.parse_args()
+
+
+def main():
+    args = _argumentos()
+
+    # Atualiza o snapshot antes de abrir o pool, para os processos só lerem o Parquet.
+    dados = DadosCompra(args.csv, args.cache)
+    dados.atualizar()
+    combinacoes = combinacoes_filtros(dados.df, args)
+
+    opcoes = {'modo_comparacao': args.modo_comparacao, 'janelas': tuple(args.janelas),
+              'dias_precos': args.dias_precos, 'n_precos': args.top_n, 'hoje': args.hoje}
+    tarefas = [(filtros, args.saida, opcoes) for filtros in combinacoes]
+    os.makedirs(args.saida, exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=args.processos, initializer=_iniciar_processo,
+                             initargs=(args.csv, args.cache)) as executor:
+        resumo = list(executor.map(_processar, tarefas, chunksize=max(1, len(tarefas) // (4 * args.processos))))
+
+    pd.DataFrame(resumo).to_csv(os.path.join(args.saida, 'resumo_metricas.csv'), index=False)
+    print(f"{len(resumo)} combinações de filtros processadas em '{args.saida}'.")
+
+
+if __name__ == '__main__':
+    main()
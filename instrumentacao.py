@@ -0,0 +1,246 @@
+"""
+Instrumentação de tempo e memória das execuções (reruns) do painel de compras.
+
+Cada rerun abre uma `MedicaoRerun` com `iniciar_medicao`; trechos do script são
+medidos com `medicao.secao(nome)` e as funções de análise decoradas com
+`@cronometrado` registram seu tempo na medição ativa do contexto atual. Sem medição
+ativa (CLI de relatórios, benchmark) o decorador só repassa a chamada.
+
+Ao finalizar, o registro do rerun entra no histórico do processo (p50/p95 entre
+todas as sessões) e é gravado como uma linha JSON no logger 'compra.desempenho'.
+
+Exemplo para resumir o log acumulado:
+    python instrumentacao.py .cache_compra/desempenho.jsonl
+"""
+import argparse
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+import numpy as np
+import pandas as pd
+
+LOGGER = logging.getLogger('compra.desempenho')
+TAMANHO_HISTORICO = 500
+PERCENTIS = (50, 95)
+
+_medicao_ativa = contextvars.ContextVar('medicao_ativa', default=None)
+_memoria_dataframes = {}
+_lock_memoria = threading.Lock()
+
+
+def memoria_processo_mb():
+    """Memória residente (RSS) atual do processo em MB, ou None se não disponível."""
+    try:
+        with open('/proc/self/statm') as arquivo:
+            paginas_residentes = int(arquivo.read().split()[1])
+        return paginas_residentes * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def memoria_dataframe(df):
+    """
+    Memória de `df` em MB (`memory_usage(deep=True)`).
+
+    O resultado é guardado por objeto enquanto ele existir, então medir a cada rerun o
+    DataFrame compartilhado do processo custa uma consulta de dicionário.
+    """
+    chave = id(df)
+    with _lock_memoria:
+        cache = _memoria_dataframes.get(chave)
+        if cache is not None and cache[0]() is df:
+            return cache[1]
+    memoria = df.memory_usage(index=True, deep=True).sum() / 2 ** 20
+    with _lock_memoria:
+        _memoria_dataframes[chave] = (weakref.ref(df, lambda _, chave=chave: _memoria_dataframes.pop(chave, None)), memoria)
+    return memoria
+
+
+class MedicaoRerun:
+    """Tempos por seção e por função e memória dos DataFrames de um rerun."""
+
+    def __init__(self, sessao):
+        self.sessao = sessao
+        self.secoes = {}
+        self.funcoes = {}
+        self.memoria = {}
+        self.registro = None
+        self._pilha = []
+        self._inicio = time.perf_counter()
+        self._memoria_inicio = memoria_processo_mb()
+        self._token = None
+
+    @contextmanager
+    def secao(self, nome):
+        """Mede o bloco como uma seção; seções aninhadas ficam como 'externa / interna'."""
+        self._pilha.append(nome)
+        nome_completo = ' / '.join(self._pilha)
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.secoes[nome_completo] = self.secoes.get(nome_completo, 0.0) + (time.perf_counter() - inicio) * 1000
+            self._pilha.pop()
+
+    def registrar_funcao(self, nome, milissegundos):
+        chamadas, total = self.funcoes.get(nome, (0, 0.0))
+        self.funcoes[nome] = (chamadas + 1, total + milissegundos)
+
+    def registrar_dataframe(self, nome, df):
+        self.memoria[nome] = memoria_dataframe(df)
+
+    def finalizar(self):
+        """Fecha o rerun, publica no histórico e no log e devolve o registro."""
+        if self.registro is not None:
+            return self.registro
+        if self._token is not None:
+            _medicao_ativa.reset(self._token)
+        memoria_fim = memoria_processo_mb()
+        memoria = {f'df {nome}': round(mb, 3) for nome, mb in self.memoria.items()}
+        if memoria_fim is not None:
+            memoria['processo'] = round(memoria_fim, 3)
+            if self._memoria_inicio is not None:
+                memoria['processo delta'] = round(memoria_fim - self._memoria_inicio, 3)
+        self.registro = {
+            'evento': 'rerun',
+            'data': datetime.now().isoformat(timespec='seconds'),
+            'sessao': self.sessao,
+            'total_ms': round((time.perf_counter() - self._inicio) * 1000, 3),
+            'secoes': {nome: round(ms, 3) for nome, ms in self.secoes.items()},
+            'funcoes': {nome: {'chamadas': chamadas, 'ms': round(ms, 3)} for nome, (chamadas, ms) in self.funcoes.items()},
+            'memoria_mb': memoria,
+        }
+        historico_desempenho.adicionar(self.registro)
+        LOGGER.info(json.dumps(self.registro, ensure_ascii=False))
+        return self.registro
+
+
+def iniciar_medicao(sessao):
+    """Cria a medição do rerun e a torna ativa para as funções `@cronometrado`."""
+    medicao = MedicaoRerun(sessao)
+    medicao._token = _medicao_ativa.set(medicao)
+    return medicao
+
+
+def medicao_ativa():
+    return _medicao_ativa.get()
+
+
+def _dataframes_do_resultado(resultado):
+    if isinstance(resultado, pd.DataFrame):
+        return [resultado]
+    if isinstance(resultado, tuple):
+        return [item for item in resultado if isinstance(item, pd.DataFrame)]
+    return []
+
+
+def cronometrado(funcao):
+    """Registra tempo e memória dos DataFrames devolvidos por `funcao` na medição ativa."""
+    nome = funcao.__qualname__
+
+    @functools.wraps(funcao)
+    def envoltorio(*args, **kwargs):
+        medicao = _medicao_ativa.get()
+        if medicao is None:
+            return funcao(*args, **kwargs)
+        inicio = time.perf_counter()
+        try:
+            resultado = funcao(*args, **kwargs)
+        finally:
+            medicao.registrar_funcao(nome, (time.perf_counter() - inicio) * 1000)
+        dataframes = _dataframes_do_resultado(resultado)
+        if dataframes:
+            medicao.memoria[nome] = sum(memoria_dataframe(df) for df in dataframes)
+        return resultado
+
+    return envoltorio
+
+
+def _tabela_percentis(registros):
+    """p50/p95 do total e de cada seção (ms) numa lista de registros de rerun."""
+    amostras = {'Total': [registro['total_ms'] for registro in registros]}
+    for registro in registros:
+        for nome, ms in registro['secoes'].items():
+            amostras.setdefault(nome, []).append(ms)
+    linhas = [
+        [nome, len(valores)] + [float(np.percentile(valores, p)) for p in PERCENTIS]
+        for nome, valores in amostras.items() if valores
+    ]
+    return pd.DataFrame(linhas, columns=['Seção', 'Reruns'] + [f'p{p} (ms)' for p in PERCENTIS])
+
+
+class HistoricoDesempenho:
+    """Últimos registros de rerun de todas as sessões do processo."""
+
+    def __init__(self, tamanho=TAMANHO_HISTORICO):
+        self._registros = deque(maxlen=tamanho)
+        self._lock = threading.Lock()
+
+    def adicionar(self, registro):
+        with self._lock:
+            self._registros.append(registro)
+
+    def registros(self):
+        with self._lock:
+            return list(self._registros)
+
+    def percentis(self):
+        return _tabela_percentis(self.registros())
+
+
+historico_desempenho = HistoricoDesempenho()
+
+
+def configurar_log_desempenho(caminho, tamanho_maximo=10 * 2 ** 20, arquivos_backup=3):
+    """Grava os registros de rerun em `caminho` (JSON lines com rotação). Idempotente."""
+    caminho = os.path.abspath(caminho)
+    for handler in LOGGER.handlers:
+        if isinstance(handler, RotatingFileHandler) and handler.baseFilename == caminho:
+            return LOGGER
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    handler = RotatingFileHandler(caminho, maxBytes=tamanho_maximo, backupCount=arquivos_backup, encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    LOGGER.addHandler(handler)
+    LOGGER.setLevel(logging.INFO)
+    LOGGER.propagate = False
+    return LOGGER
+
+
+def ler_log_desempenho(caminho):
+    """Lê os registros de rerun de um log JSON lines, ignorando linhas inválidas."""
+    registros = []
+    with open(caminho, encoding='utf-8') as arquivo:
+        for linha in arquivo:
+            try:
+                registro = json.loads(linha)
+            except json.JSONDecodeError:
+                continue
+            if registro.get('evento') == 'rerun':
+                registros.append(registro)
+    return registros
+
+
+def resumir_log_desempenho(caminho):
+    """p50/p95 do total e de cada seção a partir do log acumulado."""
+    return _tabela_percentis(ler_log_desempenho(caminho))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resume p50/p95 dos reruns registrados no log de desempenho.')
+    parser.add_argument('log', help='Arquivo JSON lines gravado pelo painel.')
+    args = parser.parse_args()
+    print(resumir_log_desempenho(args.log).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()